@@ -0,0 +1,85 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+# Micro-benchmark for query parsing and matching.
+#
+# Compares parsing every dependency string from scratch against the interned
+# queries, and matching against raw provides strings against the pre-parsed
+# provided tuples. Run with:
+#
+#   python benchmarks/bench_query.py
+import timeit
+
+from skymod.package import PackageRecord, Version
+from skymod.repository import Query, intern_query
+
+
+DEPENDS = ["skse>=1.7", "skyui>=5", "fnis", "unofficial-patch=2.1", "ussep<3"]
+PROVIDES = ["skyui=5.1", "skyui-core", "mcm=1.2", "ui-framework"]
+
+record = PackageRecord(
+    "ui-pack", "ui-pack", version="1.0", provides=PROVIDES
+)
+
+
+# How Query.matches used to look at a package, re-splitting the provides
+# strings on every call
+def old_matches(query, config):
+    if query.name == config.name:
+        return query.matches_version(config.version)
+    for p in config.provides:
+        name, *rest = p.split("=")
+        if name == query.name:
+            return query.matches_version(Version(rest[0]) if rest else None)
+    return False
+
+
+def parse_fresh():
+    for d in DEPENDS:
+        Query(d)
+
+
+def parse_interned():
+    for d in DEPENDS:
+        intern_query(d)
+
+
+queries = [Query(q) for q in ("mcm>=1", "ui-framework", "skse", "ui-pack")]
+
+
+def match_old():
+    for q in queries:
+        old_matches(q, record)
+
+
+def match_new():
+    for q in queries:
+        q.matches(record)
+
+
+def run(name, fn, number=20000):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5))
+    print("{:<16} {:8.2f} us/call".format(name, seconds / number * 1e6))
+    return seconds
+
+
+if __name__ == "__main__":
+    fresh = run("parse fresh", parse_fresh)
+    interned = run("parse interned", parse_interned)
+    print("  speedup {:.1f}x".format(fresh / interned))
+    old = run("match provides", match_old)
+    new = run("match provided", match_new)
+    print("  speedup {:.1f}x".format(old / new))
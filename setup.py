@@ -13,7 +13,6 @@ setup(
     install_requires=[
         "click",
         "networkx",
-        "fuzzywuzzy",
         "requests",
         "patool",
         "humanize",
@@ -27,6 +27,19 @@ def to_bool(name):
     return name.lower() in ("true", )
 
 
+# A number of bytes, optionally with a unit like 500M or 20GiB
+def to_size(value):
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+    value = str(value).strip().lower()
+    for suffix in ("ib", "b"):
+        if value.endswith(suffix):
+            value = value[:-len(suffix)]
+            break
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
 ValueRecords = namedtuple("ValueRecords", "default, to_type")
 _options = {
         "repo": {
@@ -34,16 +47,50 @@ _options = {
             "url": ValueRecords(
                 "https://github.com/DelusionalLogic/modbuild-repo.git",
                 str
-            )
+            ),
+            # Processes used to build the package index. 0 means one per CPU
+            "index_workers": ValueRecords(0, int),
+            # "worktree" keeps a regular checkout of the repo, "objects" reads
+            # the packages straight out of git at the given revision. The
+            # objects backend keeps its mirror clone in the dir with ".git"
+            # tacked on
+            "backend": ValueRecords("worktree", str),
+            "rev": ValueRecords("HEAD", str),
+            # Clone options for the worktree backend. A depth of 0 clones the
+            # full history, the filter is passed to git clone --filter
+            "depth": ValueRecords(0, int),
+            "filter": ValueRecords("", str),
         },
         "cache": {
             "dir": ValueRecords(_home / ".modbuild/cache",  Path),
+            # How big the download cache may grow before the least recently
+            # used downloads are evicted. 0 means no limit
+            "max_size": ValueRecords(0, to_size),
         },
         "local": {
             "dir": ValueRecords(_home / ".modbuild/local",  Path),
+            # "directory" keeps a directory per installed package, "sqlite"
+            # keeps them all in a single database
+            "backend": ValueRecords("directory", str),
+        },
+        "resolver": {
+            "engine": ValueRecords("backtracking", str),
+            # Which candidate to try first when several could satisfy
+            # a dependency, "fewest-new" or "newest"
+            "prefer": ValueRecords("fewest-new", str),
+            # How many times the resolver may back out of a choice before it
+            # settles for its preferred candidates
+            "max_backtracks": ValueRecords(10000, int),
         },
         "source": {
             "dir": ValueRecords(_home / ".modbuild/source",  Path),
+            # Same as cache.max_size, but for the extracted sources
+            "max_size": ValueRecords(0, to_size),
+        },
+        "download": {
+            # How many downloads can run at once, across all the sites. Each
+            # site has its own limit as well
+            "workers": ValueRecords(4, int),
         },
         "mo": {
             "mods_dir": ValueRecords(Path(""),  Path),
@@ -52,10 +99,12 @@ _options = {
         "nexus": {
             "username": ValueRecords("", str),
             "password": ValueRecords("", str),
+            "concurrency": ValueRecords(4, int),
         },
         "ll": {
             "username": ValueRecords("", str),
             "password": ValueRecords("", str),
+            "concurrency": ValueRecords(1, int),
         },
 }
 
@@ -85,16 +85,27 @@ class RuntimeSandbox(object):
         self.sandbox_meta["__index"] = self.safe_env
         self.setmeta = lua.eval("setmetatable")
 
+        # A modbuild that doesn't parse raises the lua error, rather than
+        # leaving us with a package where every field is nil
         self.sandboxFile = lua.eval("""
         function(path, env)
             local untrusted_function, message = loadfile(path, "t", env)
-            if not untrusted_function then return nil, message end
+            if not untrusted_function then error(message, 0) end
 
             return untrusted_function()
         end
         """)
 
-    def load_file(self, path):
+        self.sandboxString = lua.eval("""
+        function(source, name, env)
+            local untrusted_function, message = load(source, name, "t", env)
+            if not untrusted_function then error(message, 0) end
+
+            return untrusted_function()
+        end
+        """)
+
+    def _make_context(self):
         sandbox = lua.eval("{}")
         self.setmeta(sandbox, self.sandbox_meta)
 
@@ -102,6 +113,16 @@ class RuntimeSandbox(object):
         # Inject the context as the first param
         for v in _functions:
             sandbox[v.__name__] = lambda *x, v=v: v(context, *x)
+        return context
+
+    def load_file(self, path):
+        context = self._make_context()
+        self.sandboxFile(path, context.env)
+        return context
 
-        self.sandboxFile(path, sandbox)
+    # Same as load_file, but for a modbuild we already have in memory. The
+    # name is only used in lua error messages
+    def load_string(self, source, name):
+        context = self._make_context()
+        self.sandboxString(source, "=" + name, context.env)
         return context
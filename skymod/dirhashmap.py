@@ -15,8 +15,37 @@
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
 import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
 from contextlib import contextmanager
 
+from path import Path
+
+# Bump this whenever the layout of the manifest changes, a manifest with
+# another version is rebuilt from what's in the container
+MANIFEST_VERSION = 1
+
+
+def _key_hash(key):
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _is_key_hash(name):
+    if len(name) != 40:
+        return False
+    try:
+        int(name, 16)
+    except ValueError:
+        return False
+    return True
+
+
+def _dir_size(path):
+    return sum(f.size for f in path.walkfiles())
+
 
 class DirMap(object):
     def __init__(self, container_dir):
@@ -24,21 +53,73 @@ class DirMap(object):
 
         # Transaction stuff
 
-        # Since no SHA-1 hash is TEMP we can safely use that as a temp dir name
-        # in tree
-        self.temp = self.container_dir / "TEMP"
-        # Set when we know where the destination of a current transaction is
-        # going. If this is not None a transaction is running
-        self.transaction_dest = None
+        # Every allocation gets its own temp dir named TEMP something. Since
+        # no SHA-1 hash starts with TEMP they can't collide with a key, and
+        # since they are all different any number of allocations can run at
+        # once
+        self.temp_prefix = "TEMP"
+        # The keys currently being added, so two threads don't try to add the
+        # same one
+        self.allocated = set()
+        self.lock = threading.RLock()
         # Create the container dir if it doesn't exist
         if not self.container_dir.exists():
             self.container_dir.mkdir()
+        # Whatever is left from a transaction that never finished is garbage
+        for d in self.container_dir.dirs(self.temp_prefix + "*"):
+            d.rmtree()
+
+        # How big every entry is and when it was last used, keyed by the hash.
+        # It's what lets us evict without walking the whole container, and
+        # it's only loaded once someone needs it
+        self.manifest_path = self.container_dir / "MANIFEST.json"
+        self.entries = None
+        self.dirty = False
 
     def _get_path_safe(self, key):
-        key_hash = hashlib.sha1(key.encode()).hexdigest()
+        key_hash = _key_hash(key)
         key_path = self.container_dir / key_hash
         return key_path
 
+    # Load the manifest and bring it in line with what's actually in the
+    # container. Entries it doesn't know about are weighed once, and counted
+    # as used when they were last modified. Call with the lock held
+    def _load_manifest(self):
+        if self.entries is not None:
+            return
+        known = {}
+        try:
+            with open(self.manifest_path, "r") as infile:
+                data = json.load(infile)
+            if data.get("version") == MANIFEST_VERSION:
+                known = data["entries"]
+        except (OSError, ValueError):
+            pass
+
+        self.entries = {}
+        for d in self.container_dir.dirs():
+            if not _is_key_hash(d.name):
+                continue
+            entry = known.get(d.name)
+            if entry is None:
+                entry = {"size": _dir_size(d), "used": d.mtime}
+                self.dirty = True
+            self.entries[d.name] = entry
+        if len(self.entries) != len(known):
+            self.dirty = True
+
+    def _save_manifest(self):
+        if not self.dirty:
+            return
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "entries": self.entries,
+            }, outfile)
+        os.replace(tmp_path, self.manifest_path)
+        self.dirty = False
+
     def has_key(self, key):
         return self.__contains__(key)
 
@@ -48,28 +129,54 @@ class DirMap(object):
             return True
         return False
 
+    # Somewhere to keep a value while it's only partially there, like
+    # a download that broke off. It's the same path every time for the same
+    # key, so whatever is there can be picked up again later
+    def partial_path(self, key):
+        partial_dir = self.container_dir / "PARTIAL"
+        partial_dir.makedirs_p()
+        return partial_dir / _key_hash(key)
+
+    def partial_size(self):
+        partial_dir = self.container_dir / "PARTIAL"
+        if not partial_dir.exists():
+            return 0
+        return sum(f.size for f in partial_dir.files())
+
     def alloc(self, key):
-        if key in self:
-            raise KeyError("{} already in map".format(key))
+        with self.lock:
+            if key in self or key in self.allocated:
+                raise KeyError("{} already in map".format(key))
+            self.allocated.add(key)
 
-        self.transaction_dest = self._get_path_safe(key)
-        if self.temp.exists():
-            self.temp.rmtree()
-        self.temp.mkdir()
-        return self.temp
+        return Path(tempfile.mkdtemp(
+            prefix=self.temp_prefix,
+            dir=self.container_dir
+        ))
 
     def clear(self):
-        assert(self.transaction_dest is None)
+        assert(not self.allocated)
         for d in self.container_dir.dirs():
             d.rmtree()
+        with self.lock:
+            self.entries = {}
+            self.dirty = True
+            self._save_manifest()
 
-    def abort(self):
-        self.temp.rmtree()
-        self.transaction_dest = None
+    def abort(self, key, temp):
+        temp.rmtree()
+        with self.lock:
+            self.allocated.discard(key)
 
-    def commit(self):
-        self.temp.rename(self.transaction_dest)
-        self.transaction_dest = None
+    def commit(self, key, temp):
+        size = _dir_size(temp)
+        temp.rename(self._get_path_safe(key))
+        with self.lock:
+            self.allocated.discard(key)
+            self._load_manifest()
+            self.entries[_key_hash(key)] = {"size": size, "used": time.time()}
+            self.dirty = True
+            self._save_manifest()
 
     @contextmanager
     def atomic_add(m, key):
@@ -77,17 +184,107 @@ class DirMap(object):
         try:
             yield h
         except Exception:
-            m.abort()
+            m.abort(key, h)
             raise
-        m.commit()
+        m.commit(key, h)
 
+    # Getting a value counts as using it. We only remember that in memory,
+    # it's saved along with the next change or eviction
     def get(self, key):
         if key not in self:
             raise KeyError("{} not in map".format(key))
 
+        with self.lock:
+            self._load_manifest()
+            entry = self.entries.get(_key_hash(key))
+            if entry is not None:
+                entry["used"] = time.time()
+                self.dirty = True
+
         key_path = self._get_path_safe(key)
         return key_path
 
     def remove(self, key):
         key_path = self._get_path_safe(key)
         key_path.rmtree()
+        with self.lock:
+            if self.entries is not None:
+                self.entries.pop(key_path.name, None)
+                self.dirty = True
+                self._save_manifest()
+
+    # The paths of every value in the map
+    def paths(self):
+        return [
+            d for d in self.container_dir.dirs() if _is_key_hash(d.name)
+        ]
+
+    # Some values only refer to what they store, in which case the owner can
+    # tell us what they actually weigh
+    def set_size(self, key, size):
+        with self.lock:
+            self._load_manifest()
+            entry = self.entries.get(_key_hash(key))
+            if entry is not None and entry["size"] != size:
+                entry["size"] = size
+                self.dirty = True
+                self._save_manifest()
+
+    def total_size(self):
+        with self.lock:
+            self._load_manifest()
+            self._save_manifest()
+            return sum(e["size"] for e in self.entries.values())
+
+    # Throw away the least recently used values until the rest fits in the
+    # budget. The values for the kept keys, and the ones being added right
+    # now, are never thrown away. A budget of 0 means there's no limit.
+    # Returns the number of bytes freed
+    def evict(self, budget, keep=()):
+        with self.lock:
+            self._load_manifest()
+            freed = 0
+            if budget > 0:
+                keep = {_key_hash(k) for k in set(keep) | self.allocated}
+                total = sum(e["size"] for e in self.entries.values())
+                by_age = sorted(
+                    self.entries.items(),
+                    key=lambda item: item[1]["used"]
+                )
+                for (key_hash, entry) in by_age:
+                    if total <= budget:
+                        break
+                    if key_hash in keep:
+                        continue
+                    (self.container_dir / key_hash).rmtree_p()
+                    del self.entries[key_hash]
+                    total -= entry["size"]
+                    freed += entry["size"]
+                    self.dirty = True
+            self._save_manifest()
+            return freed
+
+    # Throw away every value, and every partial value, that isn't for one of
+    # the kept keys. Returns the number of bytes freed
+    def retain(self, keep):
+        with self.lock:
+            self._load_manifest()
+            keep = {_key_hash(k) for k in set(keep) | self.allocated}
+            freed = 0
+            for key_hash in list(self.entries.keys()):
+                if key_hash in keep:
+                    continue
+                (self.container_dir / key_hash).rmtree_p()
+                freed += self.entries.pop(key_hash)["size"]
+                self.dirty = True
+
+            partial_dir = self.container_dir / "PARTIAL"
+            if partial_dir.exists():
+                for f in partial_dir.files():
+                    # Partial values might have some bookkeeping next to them
+                    if f.name.split(".", 1)[0] in keep:
+                        continue
+                    freed += f.size
+                    f.remove()
+            self._save_manifest()
+            return freed
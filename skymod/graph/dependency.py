@@ -15,12 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
 import networkx as nx
-from networkx.algorithms.approximation.connectivity import (
-    local_node_connectivity
-)
 from networkx.algorithms.traversal.depth_first_search import dfs_tree
 
-import query as Q
+import skymod.query as Q
+from skymod.repository import Query
+
+from .dominators import dominated_by, dominator_tree
 
 
 #@ENHANCE: Right now the strategy is baked into the solver. Maybe pull that out
@@ -86,18 +86,13 @@ class DependencyGraph(object):
         print(graph_to_ascii(self.G))
 
     def subtree_from(self, package):
-        return DependencyGraph(dfs_tree(self.G, package))
+        return DependencyGraph(dfs_tree(self.G, package), package)
 
+    # The part of the subtree from the package that nothing outside of it
+    # depends on. Those are exactly the nodes the package dominates
     def exclude_subtree_from(self, package):
-        sub = dfs_tree(self.G, package)
-        seen = {package}
-        for n in sub.nodes():
-            if n in seen:
-                continue
-            seen.add(n)
-            if local_node_connectivity(self.G, self.root, n) > 1:
-                sub.remove_nodes_from(DependencyGraph(sub).exclude_subtree_from(n))
-        return DependencyGraph(sub)
+        owned = dominated_by(dominator_tree(self.G, self.root), package)
+        return DependencyGraph(self.G.subgraph(owned).copy(), package)
 
     def __iter__(self):
         return self.G.__iter__()
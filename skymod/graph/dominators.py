@@ -0,0 +1,40 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import networkx as nx
+
+
+# The dominator tree of G, as node -> [nodes it immediately dominates]. A node
+# dominates another if every path from the root to the other goes through it.
+# Only nodes reachable from the root are in the tree.
+def dominator_tree(G, root):
+    tree = {}
+    for (node, idom) in nx.immediate_dominators(G, root).items():
+        if node != idom:
+            tree.setdefault(idom, []).append(node)
+    return tree
+
+
+# The node and everything it dominates, which is exactly what can't be reached
+# from the root without going through it
+def dominated_by(tree, node):
+    found = {node}
+    stack = [node]
+    while stack:
+        for child in tree.get(stack.pop(), ()):
+            found.add(child)
+            stack.append(child)
+    return found
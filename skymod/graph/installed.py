@@ -14,11 +14,18 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+
 import networkx as nx
-from networkx.algorithms.approximation.connectivity import (
-    local_node_connectivity
-)
-from networkx.algorithms.traversal.depth_first_search import dfs_tree
+
+from skymod.package import InstallReason
+
+from .dominators import dominated_by, dominator_tree
+
+# Bump this whenever the layout of the saved graph changes. A graph with
+# another version is thrown away and rebuilt from the index
+GRAPH_VERSION = 1
 
 
 class RootNode(object):
@@ -32,31 +39,172 @@ class RootNode(object):
 # installed
 # An InstalledGraph has multiple package "roots" augmented with a fake super
 # root pointing at everything explicitly installed
+#
+# The packages are keyed by name, with the install reason, priority and
+# version as node attributes. A package has an edge to every installed package
+# satisfying one of its dependencies. The graph is built from the local index
+# and saved next to it, after that the local repo keeps it updated as packages
+# come and go.
 class InstalledGraph(object):
-    def __init__(self, G):
-        self.G = G
+    def __init__(self, G=None, root=None):
+        self.G = G if G is not None else nx.DiGraph()
+        self.root = root if root is not None else RootNode()
+        self.G.add_node(self.root)
 
+    @staticmethod
     def from_depends(subtrees):
         G = nx.DiGraph()
         root = RootNode()
         for subG in subtrees:
-            self.G = nx.compose(G, subG.G)
-            self.G.add_edge(root, subG.root)
+            G = nx.compose(G, subG.G)
+            G.add_edge(root, subG.root)
         return InstalledGraph(G, root)
 
-    def exclude_subtree_from(self, package):
-        sub = dfs_tree(self.G, package)
-        root = nx.topological_sort(self.G)[0]
-        seen = {package}
-        for n in sub.nodes():
-            if n in seen:
-                continue
-            seen.add(n)
-            if local_node_connectivity(self.G, root, n) > 1:
-                sub.remove_nodes_from(InstalledGraph(sub).exclude_subtree_from(n))
-        return InstalledGraph(sub)
+    @staticmethod
+    def from_index(index):
+        graph = InstalledGraph()
+        for record in index.records():
+            graph._add_node(record)
+        for record in index.records():
+            for dep in index.find_dependencies(record):
+                graph.G.add_edge(record.name, dep.name)
+        return graph
+
+    def _add_node(self, record):
+        self.G.add_node(
+            record.name,
+            version=str(record.version),
+            reason=record.reason,
+            priority=record.priority
+        )
+        if record.reason == InstallReason.REQ:
+            self.G.add_edge(self.root, record.name)
+
+    # Add a package that was just added to the index. Besides having its own
+    # dependencies it might satisfy some of the installed packages
+    def add(self, record, index):
+        self.remove(record.name)
+        self._add_node(record)
+        for dep in index.find_dependencies(record):
+            if dep.name in self.G:
+                self.G.add_edge(record.name, dep.name)
+        for dependant in index.find_dependants(record):
+            if dependant.name in self.G and dependant != record:
+                self.G.add_edge(dependant.name, record.name)
+
+    def remove(self, name):
+        if name in self.G:
+            self.G.remove_node(name)
+
+    # Does the graph still match what the index says is installed. The
+    # dependencies are compared as well, a package can change what it depends
+    # on without changing its version
+    def is_current(self, index):
+        if len(self.G) - 1 != len(index):
+            return False
+        for record in index.records():
+            node = self.G.nodes.get(record.name)
+            if node is None:
+                return False
+            if (node["version"] != str(record.version) or
+                    node["reason"] != record.reason or
+                    node["priority"] != record.priority):
+                return False
+            dependencies = {
+                dep.name for dep in index.find_dependencies(record)
+            }
+            if set(self.dependencies(record.name)) != dependencies:
+                return False
+        return True
+
+    def packages(self):
+        return (n for n in self.G if n is not self.root)
+
+    def reason(self, name):
+        return self.G.nodes[name]["reason"]
+
+    def priority(self, name):
+        return self.G.nodes[name]["priority"]
+
+    def dependencies(self, name):
+        return self.G.successors(name)
+
+    def dependants(self, name):
+        return (n for n in self.G.predecessors(name) if n is not self.root)
+
+    @staticmethod
+    def load(path):
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r") as infile:
+                data = json.load(infile)
+        except ValueError:
+            return None
+        if data.get("version") != GRAPH_VERSION:
+            return None
+
+        graph = InstalledGraph()
+        for (name, node) in data["nodes"].items():
+            graph.G.add_node(
+                name,
+                version=node["version"],
+                reason=InstallReason[node["reason"]],
+                priority=node["priority"]
+            )
+            if graph.reason(name) == InstallReason.REQ:
+                graph.G.add_edge(graph.root, name)
+        graph.G.add_edges_from(data["edges"])
+        return graph
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump({
+                "version": GRAPH_VERSION,
+                "nodes": {
+                    name: {
+                        "version": self.G.nodes[name]["version"],
+                        "reason": self.reason(name).name,
+                        "priority": self.priority(name),
+                    }
+                    for name in self.packages()
+                },
+                "edges": sorted(
+                    [a, b] for (a, b) in self.G.edges() if a is not self.root
+                ),
+            }, outfile)
+        os.replace(tmp_path, path)
+
+    # The dominator tree of the installed packages. Packages nothing depends
+    # on and weren't explicitly installed are treated as roots as well, same
+    # for whatever still can't be reached from the root after that, which is
+    # packages only depending on each other in a cycle
+    def dominator_tree(self):
+        G = nx.DiGraph(self.G)
+        for name in self.packages():
+            if G.in_degree(name) == 0:
+                G.add_edge(self.root, name)
+        reachable = nx.descendants(G, self.root)
+        for name in self.packages():
+            if name not in reachable:
+                G.add_edge(self.root, name)
+        return dominator_tree(G, self.root)
+
+    # The package and the dependencies only it holds on to, which is what
+    # would go away with it
+    def exclude_subtree_from(self, name, tree=None):
+        if tree is None:
+            tree = self.dominator_tree()
+        owned = dominated_by(tree, name)
+        root = RootNode()
+        sub = self.G.subgraph(owned).copy()
+        sub.add_edge(root, name)
+        return InstalledGraph(sub, root)
 
     def present(self):
+        # How about we don't fire up a JVM just to start my script?
+        from asciinet import graph_to_ascii
         print(graph_to_ascii(self.G))
 
     def __iter__(self):
@@ -0,0 +1,76 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+# Tarjan's strongly connected components over a dependency graph, where an
+# edge points from a package to something it depends on. A component is only
+# finished once everything it depends on is, so the components come out in
+# the order they have to be installed in. Any component with more than one
+# package in it, or a package depending on itself, is a cycle.
+#
+# It's done with an explicit stack, deep dependency chains would blow the
+# recursion limit otherwise. If a key is given the packages and their
+# dependencies are visited in that order, which keeps the output stable.
+#
+# Returns the install order and a list of the cycles found
+def install_order(G, key=None):
+    def ordered(nodes):
+        if key is None:
+            return list(nodes)
+        return sorted(nodes, key=key)
+
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    order = []
+    cycles = []
+
+    def visit(node):
+        index[node] = lowlink[node] = len(index)
+        stack.append(node)
+        on_stack.add(node)
+        return (node, iter(ordered(G.successors(node))))
+
+    for start in ordered(G):
+        if start in index:
+            continue
+        work = [visit(start)]
+        while work:
+            (node, successors) = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    work.append(visit(succ))
+                    break
+                if succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] != index[node]:
+                    continue
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member is node:
+                        break
+                if len(component) > 1 or G.has_edge(node, node):
+                    cycles.append(ordered(component))
+                order.extend(component)
+    return (order, cycles)
@@ -0,0 +1,141 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import os
+import threading
+
+
+# Hashes a download as it's written, so we never have to read it back. We
+# always want the sha256 since that's what the blobs are stored under, along
+# with whatever the source asked for.
+class StreamHasher(object):
+    def __init__(self, algorithms=()):
+        self.algorithms = set(algorithms) | {"sha256"}
+        self.reset()
+
+    def reset(self):
+        self.hashes = {a: hashlib.new(a) for a in self.algorithms}
+        # How many bytes we've seen
+        self.size = 0
+
+    def update(self, data):
+        for h in self.hashes.values():
+            h.update(data)
+        self.size += len(data)
+
+    # Feed it the part of a file between start and end. For when the bytes
+    # weren't streamed through us, like the beginning of a resumed download
+    def update_from(self, path, start=0, end=None):
+        with open(path, "rb") as infile:
+            infile.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                size = 1024 * 1024
+                if remaining is not None:
+                    size = min(size, remaining)
+                chunk = infile.read(size)
+                if not chunk:
+                    break
+                self.update(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+    def digests(self):
+        return {a: h.hexdigest() for a, h in self.hashes.items()}
+
+
+# Downloaded files stored under the sha256 of their content. If two uris turn
+# out to give the same file they share the blob. Along with the blobs we keep
+# the stamp every blob had when we last knew it was good, so anyone finding
+# a blob by its digest can trust it without hashing it again.
+class BlobStore(object):
+    def __init__(self, root):
+        self.root = root
+        self.root.makedirs_p()
+        self._stamps_path = root / ".stamps.json"
+        self._stamps = None
+        # The downloads add blobs from several threads at once
+        self.lock = threading.Lock()
+
+    def path(self, digest):
+        return self.root / digest
+
+    def __contains__(self, digest):
+        return self.path(digest).exists()
+
+    # Move the file into the store. If we have the blob already the new copy
+    # just replaces it, it's the same bytes after all
+    def add(self, digest, path):
+        os.replace(path, self.path(digest))
+        return self.path(digest)
+
+    def remove(self, digest):
+        self.path(digest).remove_p()
+        with self.lock:
+            if self._load_stamps().pop(digest, None) is not None:
+                self._save_stamps()
+
+    def _blob_files(self):
+        return (f for f in self.root.files() if not f.name.startswith("."))
+
+    def __iter__(self):
+        return (f.name for f in self._blob_files())
+
+    def size(self):
+        return sum(f.size for f in self._blob_files())
+
+    # A cheap check for changes, if this is the same as last time we looked
+    # we don't have to hash the blob again
+    def stamp(self, digest):
+        stat = self.path(digest).stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_stamps(self):
+        if self._stamps is None:
+            try:
+                with open(self._stamps_path, "r") as infile:
+                    self._stamps = json.load(infile)
+            except (OSError, ValueError):
+                self._stamps = {}
+        return self._stamps
+
+    def _save_stamps(self):
+        tmp_path = self._stamps_path + ".tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump(self._stamps, outfile)
+        os.replace(tmp_path, self._stamps_path)
+
+    # Remember that the blob is good as it is now. Call it once the blob has
+    # been hashed, either while it was written or after
+    def verified(self, digest):
+        stamp = self.stamp(digest)
+        with self.lock:
+            self._load_stamps()[digest] = stamp
+            self._save_stamps()
+
+    # Is the blob unchanged since it was last known to be good
+    def is_verified(self, digest):
+        stamp = self.stamp(digest)
+        with self.lock:
+            return self._load_stamps().get(digest) == stamp
+
+    # Hash the blob to check that it's still what we stored
+    def digests(self, digest, algorithms=()):
+        hasher = StreamHasher(algorithms)
+        hasher.update_from(self.path(digest))
+        return hasher.digests()
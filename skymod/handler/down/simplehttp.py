@@ -14,33 +14,218 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import json
+
+from path import Path
+from requests.exceptions import RequestException
 from tqdm import tqdm
 
 from ..sessionfactory import SessionFactory
 
 
+# Lets a bar of our own stand in for the progress of the downloader
+class _BarProgress(object):
+    def __init__(self, bar):
+        self.bar = bar
+
+    def add_total(self, size):
+        self.bar.total += size
+        self.bar.refresh()
+
+    def update(self, size):
+        self.bar.update(size)
+
+
+# "bytes 100-999/1000" -> (100, 1000). The total is None if the server
+# doesn't know it
+def _parse_content_range(value):
+    try:
+        (unit, rest) = value.split(" ", 1)
+        (span, total) = rest.split("/", 1)
+        start = int(span.split("-", 1)[0])
+    except (AttributeError, ValueError):
+        return None
+    if unit != "bytes":
+        return None
+    return (start, None if total == "*" else int(total))
+
+
+# Downloads are written straight to the file we are given. If a download
+# breaks off, what we got so far is kept along with what the server told us
+# about the file. The next attempt asks for just the rest with a Range
+# request, and If-Range makes sure we get the whole thing again if the file
+# changed in the meantime.
 class SimpleHttpDownloader(SessionFactory):
+    # How many times a download that broke off is resumed before we give up
+    retries = 3
+
     def __init__(self):
         super().__init__()
 
-    def download_file(self, name, url, headers, filename):
+    def _meta_path(self, filename):
+        return Path(filename + ".json")
+
+    def _load_meta(self, filename):
+        meta_path = self._meta_path(filename)
+        if not filename.exists() or not meta_path.exists():
+            return None
+        try:
+            with open(meta_path, "r") as infile:
+                return json.load(infile)
+        except ValueError:
+            return None
+
+    def _save_meta(self, filename, meta):
+        with open(self._meta_path(filename), "w") as outfile:
+            json.dump(meta, outfile)
+
+    def _discard(self, filename):
+        filename.remove_p()
+        self._meta_path(filename).remove_p()
+
+    # What we can resume against. A weak ETag doesn't promise the bytes are
+    # the same, so it's no good for that
+    def _validator(self, meta):
+        etag = meta.get("etag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return meta.get("last_modified")
+
+    # Ask for whatever we don't have yet. Returns the response (None if we
+    # already have everything), where in the file it starts, and what we know
+    # about the file
+    def _request(self, url, headers, filename):
+        meta = self._load_meta(filename)
+        offset = 0
+        if meta is not None and self._validator(meta) is not None:
+            offset = filename.size
+        range_headers = dict(headers)
+        if offset > 0:
+            range_headers["Range"] = "bytes={}-".format(offset)
+            range_headers["If-Range"] = self._validator(meta)
+
         r = super().getSession().get(
             url,
             allow_redirects=True,
-            headers=headers,
+            headers=range_headers,
             stream=True
         )
 
+        if offset > 0 and r.status_code == 206:
+            content_range = _parse_content_range(
+                r.headers.get("content-range")
+            )
+            etag = r.headers.get("etag")
+            if (content_range == (offset, meta["length"]) and
+                    (etag is None or etag == meta["etag"])):
+                return (r, offset, meta)
+            # That's not the rest of the file we have
+            r.close()
+            self._discard(filename)
+            return self._request(url, headers, filename)
+        if offset > 0 and r.status_code == 416 and offset == meta["length"]:
+            # We had all of it, we just didn't get to check it
+            r.close()
+            return (None, offset, meta)
+
         if r.status_code != 200:
+            r.close()
             raise RuntimeError(
                 "Failed downloading file due to non 200 return code. "
                 "Return code was " + str(r.status_code)
             )
 
-        total_size = int(r.headers.get("content-length", 0))
-        with tqdm(desc=name, total=total_size, unit='B',
-                  unit_scale=True, miniters=1) as bar:
-            with open(filename, 'wb') as fd:
-                for chunk in r.iter_content(32*1024):
-                    bar.update(len(chunk))
-                    fd.write(chunk)
+        length = int(r.headers.get("content-length", 0))
+        meta = {
+            "etag": r.headers.get("etag"),
+            "last_modified": r.headers.get("last-modified"),
+            "length": length if length > 0 else None,
+        }
+        self._save_meta(filename, meta)
+        return (r, 0, meta)
+
+    def _download(self, url, headers, filename, progress, hasher):
+        # How much of the file the progress has been told about
+        counted = None
+        attempt = 0
+        while True:
+            (r, offset, meta) = self._request(url, headers, filename)
+            if counted is None:
+                progress.add_total(meta["length"] or 0)
+                progress.update(offset)
+                counted = offset
+            elif offset < counted:
+                # We are starting over, so the bytes are coming again
+                progress.add_total(counted - offset)
+                counted = offset
+
+            # The hasher has to see every byte of the file exactly once. If we
+            # are resuming a download from an earlier run it hasn't seen the
+            # beginning
+            if hasher is not None:
+                if hasher.size > offset:
+                    hasher.reset()
+                if hasher.size < offset:
+                    hasher.update_from(filename, hasher.size, offset)
+
+            if r is not None:
+                try:
+                    with open(filename, "ab" if offset > 0 else "wb") as fd:
+                        for chunk in r.iter_content(32*1024):
+                            fd.write(chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                            progress.update(len(chunk))
+                            counted += len(chunk)
+                except RequestException:
+                    attempt += 1
+                    if attempt > self.retries:
+                        raise
+                    continue
+                finally:
+                    r.close()
+
+            # Make sure we got all of it before anyone gets to use it
+            size = filename.size
+            if meta["length"] is not None and size != meta["length"]:
+                if size > meta["length"]:
+                    self._discard(filename)
+                    raise RuntimeError(
+                        "Download of {} is larger than expected".format(url)
+                    )
+                attempt += 1
+                if attempt > self.retries:
+                    raise RuntimeError(
+                        "Download of {} ended early".format(url)
+                    )
+                continue
+            self._meta_path(filename).remove_p()
+            return
+
+    # Without a progress to report to, the download gets a bar of its own. If
+    # we get a hasher every byte of the file is fed through it as we go
+    def download_file(
+        self,
+        name,
+        url,
+        headers,
+        filename,
+        progress=None,
+        hasher=None
+    ):
+        filename = Path(filename)
+        # The length and the ranges have to be about the bytes we write
+        headers = dict(headers)
+        headers["Accept-Encoding"] = "identity"
+        if progress is None:
+            with tqdm(desc=name, total=0, unit='B',
+                      unit_scale=True, miniters=1) as bar:
+                self._download(
+                    url,
+                    headers,
+                    filename,
+                    _BarProgress(bar),
+                    hasher
+                )
+        else:
+            self._download(url, headers, filename, progress, hasher)
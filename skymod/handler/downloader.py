@@ -14,33 +14,332 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 from tqdm import tqdm
 
 from skymod.cfg import config as cfg
 from skymod.dirhashmap import DirMap
 
+from .blobstore import BlobStore, StreamHasher
+from .errors import ChecksumError
+
+
+# A single progress bar for all the downloads running at once. The total grows
+# as the downloads find out how big they are.
+class DownloadProgress(object):
+    def __init__(self, count):
+        self.count = count
+        self.done = 0
+        self.lock = threading.Lock()
+        self.bar = tqdm(
+            desc=self._desc(),
+            total=0,
+            unit="B",
+            unit_scale=True,
+            miniters=1
+        )
+
+    def _desc(self):
+        return "Downloading {}/{}".format(self.done, self.count)
+
+    def add_total(self, size):
+        with self.lock:
+            self.bar.total += size
+            self.bar.refresh()
+
+    def update(self, size):
+        with self.lock:
+            self.bar.update(size)
+
+    def write(self, message):
+        with self.lock:
+            self.bar.write(message)
+
+    def file_done(self):
+        with self.lock:
+            self.done += 1
+            self.bar.set_description(self._desc())
+
+    def close(self):
+        self.bar.close()
+
 
+# The files are kept in a blob store under the cache, addressed by their
+# sha256. The cache entry for a uri is just a reference to the blob, along
+# with the digests we know for it and a stamp of the blob when we last checked
+# it. If the stamp changed the blob is hashed again, and if it's not what we
+# downloaded we throw it away and download it again.
 class Downloader(object):
     def __init__(self, cache=None):
         self.handlers = set()
         self.cache = cache or DirMap(cfg.cache.dir)
+        self.blobs = BlobStore(self.cache.container_dir / "BLOBS")
 
     def add_handler(self, handler):
         self.handlers.add(handler)
 
-    def fetch_file(self, uri, filename):
-        print("Fetching {}".format(filename))
-        # Is the uri cached
-        if uri in self.cache:
-            tqdm.write("{} found in cache".format(uri))
-            return (self.cache.get(uri) / "file", filename)
+    def _find_handler(self, uri):
+        for handler in self.handlers:
+            if handler.accept(uri):
+                return handler
+        return None
+
+    def _write_ref(self, path, ref):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump(ref, outfile)
+        os.replace(tmp_path, path)
 
+    def _link(self, uri, digests):
+        ref = {
+            "digests": digests,
+            "stamp": self.blobs.stamp(digests["sha256"]),
+        }
         with self.cache.atomic_add(uri) as dl_cache:
-            for handler in self.handlers:
-                if handler.accept(uri):
-                    handler.fetch(uri, dl_cache / "file")
+            self._write_ref(dl_cache / "ref.json", ref)
+        # The entry is only a reference, it's the blob that takes up room
+        self.cache.set_size(uri, ref["stamp"][0])
+
+    def _read_ref(self, uri):
+        entry = self.cache.get(uri)
+        try:
+            with open(entry / "ref.json", "r") as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            pass
+        # Downloaded before we had the blob store. Hash it once and move it in
+        legacy = entry / "file"
+        if not legacy.exists():
+            return None
+        hasher = StreamHasher()
+        hasher.update_from(legacy)
+        digests = hasher.digests()
+        self.blobs.add(digests["sha256"], legacy)
+        self.blobs.verified(digests["sha256"])
+        ref = {
+            "digests": digests,
+            "stamp": self.blobs.stamp(digests["sha256"]),
+        }
+        self._write_ref(entry / "ref.json", ref)
+        self.cache.set_size(uri, ref["stamp"][0])
+        return ref
+
+    # The blob cached for the uri, or None if there's nothing usable. A blob
+    # is only hashed again if it changed since we last looked, or if the
+    # source wants a checksum we haven't computed yet
+    def _find_cached(self, uri, checksum):
+        if uri not in self.cache:
+            return None
+        ref = self._read_ref(uri)
+        if ref is None:
+            return None
+        digests = ref["digests"]
+        digest = digests["sha256"]
+        if digest not in self.blobs:
+            return None
+
+        stamp = self.blobs.stamp(digest)
+        wanted = set(digests.keys())
+        if checksum is not None:
+            wanted.add(checksum[0])
+        if stamp != ref["stamp"] or not wanted <= digests.keys():
+            found = self.blobs.digests(digest, wanted)
+            if any(found[a] != d for (a, d) in digests.items()):
+                tqdm.write("{} is corrupt in the cache".format(uri))
+                self.blobs.remove(digest)
+                return None
+            digests = found
+            self.blobs.verified(digest)
+            self._write_ref(
+                self.cache.get(uri) / "ref.json",
+                {"digests": digests, "stamp": stamp}
+            )
+
+        if checksum is not None and digests[checksum[0]] != checksum[1]:
+            return None
+        return self.blobs.path(digest)
+
+    # Another uri might have given us the file already. We can only tell if
+    # the source told us its sha256. The blob was checked when it was
+    # written, so we only hash it again if it changed since
+    def _find_blob(self, uri, checksum):
+        if checksum is None or checksum[0] != "sha256":
+            return None
+        digest = checksum[1]
+        if digest not in self.blobs:
+            return None
+        if not self.blobs.is_verified(digest):
+            if self.blobs.digests(digest)["sha256"] != digest:
+                self.blobs.remove(digest)
+                return None
+            self.blobs.verified(digest)
+        self._link(uri, {"sha256": digest})
+        return self.blobs.path(digest)
+
+    # The handler downloads to the partial path for the uri, and the file is
+    # only moved into the blobs once it's all there and checks out. Handlers
+    # that can resume a download pick up whatever an earlier attempt left
+    # there
+    def _download(self, handler, uri, filename, checksum, progress):
+        progress.write("Fetching {}".format(filename))
+        partial = self.cache.partial_path(uri)
+        hasher = StreamHasher([checksum[0]] if checksum else [])
+        handler.fetch(uri, partial, progress, hasher)
+        # Not every handler streams through the hasher
+        if hasher.size != partial.size:
+            hasher.reset()
+            hasher.update_from(partial)
+        digests = hasher.digests()
 
-        return (self.cache.get(uri) / "file", filename)
+        if checksum is not None and digests[checksum[0]] != checksum[1]:
+            partial.remove()
+            raise ChecksumError(uri, checksum, digests[checksum[0]])
+
+        self.blobs.add(digests["sha256"], partial)
+        self.blobs.verified(digests["sha256"])
+        self._link(uri, digests)
+        progress.file_done()
+        return (self.blobs.path(digests["sha256"]), filename)
+
+    def fetch_file(self, uri, filename, checksum=None):
+        return self.fetch([(uri, filename, checksum)])[uri]
+
+    # The downloads run on a pool of workers, but a handler never gets more
+    # of them than its concurrency allows. Instead of tying up a worker
+    # waiting for its turn, the downloads for a busy handler wait in its queue
+    # until one of its running downloads finish.
+    def fetch(self, entries):
+        files = {}
+        queues = {}
+        queued = set()
+        # Sources waiting for another uri to download the same file
+        waiting = []
+        for (uri, filename, checksum) in entries:
+            # The same source might be listed under several filenames, but
+            # we only want to download it once
+            if uri in queued or uri in files:
+                continue
+            # Is the uri cached
+            path = self._find_cached(uri, checksum)
+            if path is None:
+                if uri in self.cache:
+                    self.cache.remove(uri)
+                path = self._find_blob(uri, checksum)
+            if path is not None:
+                tqdm.write("{} found in cache".format(uri))
+                files[uri] = (path, filename)
+                continue
+            if checksum in queued:
+                waiting.append((uri, filename, checksum))
+                continue
+            handler = self._find_handler(uri)
+            if handler is None:
+                raise ValueError("No handler for {}".format(uri))
+            queues.setdefault(handler, deque()).append(
+                (uri, filename, checksum)
+            )
+            queued.add(uri)
+            if checksum is not None and checksum[0] == "sha256":
+                queued.add(checksum)
+
+        if queues:
+            self._run(queues, files)
+
+        for (uri, filename, checksum) in waiting:
+            files[uri] = (self._find_blob(uri, checksum), filename)
+        return files
+
+    def _run(self, queues, files):
+        # Logging in might ask for a password, and we can't have several
+        # threads doing that at once
+        for handler in queues.keys():
+            handler.login()
+
+        workers = max(1, cfg.download.workers)
+        progress = DownloadProgress(sum(len(q) for q in queues.values()))
+        # Future -> (handler, uri)
+        running = {}
+        active = {handler: 0 for handler in queues.keys()}
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while running or any(queues.values()):
+                    for (handler, queue) in queues.items():
+                        limit = max(1, handler.concurrency)
+                        while (queue and len(running) < workers and
+                                active[handler] < limit):
+                            (uri, filename, checksum) = queue.popleft()
+                            future = pool.submit(
+                                self._download,
+                                handler,
+                                uri,
+                                filename,
+                                checksum,
+                                progress
+                            )
+                            running[future] = (handler, uri)
+                            active[handler] += 1
+
+                    (done, _) = wait(
+                        running.keys(),
+                        return_when=FIRST_COMPLETED
+                    )
+                    for future in done:
+                        (handler, uri) = running.pop(future)
+                        active[handler] -= 1
+                        # If a download failed we stop starting new ones, the
+                        # running ones are left to finish so they end up in
+                        # the cache for next time
+                        files[uri] = future.result()
+        finally:
+            progress.close()
+
+    # Remove the blobs no uri refers to anymore
+    def _sweep_blobs(self):
+        referenced = set()
+        for entry in self.cache.paths():
+            try:
+                with open(entry / "ref.json", "r") as infile:
+                    referenced.add(json.load(infile)["digests"]["sha256"])
+            except (OSError, ValueError, KeyError):
+                continue
+        for digest in list(self.blobs):
+            if digest not in referenced:
+                self.blobs.remove(digest)
+
+    # What the cache takes up on disk. A blob shared by several uris is only
+    # counted once here, while the budget counts it for every uri
+    def size(self):
+        size = self.blobs.size() + self.cache.partial_size()
+        # Entries from before the blob store hold the file themselves
+        for entry in self.cache.paths():
+            legacy = entry / "file"
+            if legacy.exists():
+                size += legacy.size
+        return size
+
+    # Evict the least recently used downloads until the cache fits in the
+    # budget, never touching the kept uris. A budget of 0 means there's no
+    # limit, so we don't even walk the cache. Returns the bytes freed
+    def evict(self, budget, keep=()):
+        if not budget:
+            return 0
+        before = self.size()
+        if self.cache.evict(budget, keep):
+            self._sweep_blobs()
+        return before - self.size()
+
+    # Remove every download that isn't for one of the kept uris. Returns the
+    # bytes freed
+    def retain(self, keep):
+        before = self.size()
+        self.cache.retain(keep)
+        self._sweep_blobs()
+        return before - self.size()
 
     def check_file(self, uri):
         for handler in self.handlers:
@@ -50,12 +349,6 @@ class Downloader(object):
 
         return False
 
-    def fetch(self, entries):
-        files = {}
-        for (uri, filename) in entries:
-            files[uri] = self.fetch_file(uri, filename)
-        return files
-
     def check(self, entries):
         files = {}
         for uri in tqdm(entries, desc="Checking"):
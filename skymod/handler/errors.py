@@ -17,3 +17,18 @@
 
 class AuthorizationError(Exception):
     pass
+
+
+class ChecksumError(Exception):
+    def __init__(self, uri, checksum, actual):
+        self.uri = uri
+        self.checksum = checksum
+        self.actual = actual
+        super().__init__(
+            "{} should have {} {}, but the download has {}".format(
+                uri,
+                checksum[0],
+                checksum[1],
+                actual
+            )
+        )
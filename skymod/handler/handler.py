@@ -18,5 +18,15 @@ from urllib.parse import urlparse
 
 
 class Handler(object):
+    # How many downloads the handler can have running at once
+    concurrency = 1
+
+    # Called on the main thread before any downloads start. Anything that
+    # might have to ask the user for something, like a password, has to happen
+    # here. fetch runs on the download workers, several at once, so it must
+    # not try to log in itself
+    def login(self):
+        pass
+
     def accept(self, uri):
         return self.scheme == urlparse(uri).scheme
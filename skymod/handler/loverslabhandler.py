@@ -34,12 +34,14 @@ class LoversLabHandler(Handler, LoversLabAuthenticator, SimpleHttpDownloader):
 
     def __init__(self):
         self.cfg = config.ll
+        self.concurrency = self.cfg.concurrency
         super().__init__()
 
-    def fetch(self, uri, filename):
+    def login(self):
         if super().needs_login():
             super().perform_login(self.cfg, self.headers)
 
+    def fetch(self, uri, filename, progress=None, hasher=None):
         session = super().getSession()
 
         parts = urlparse(uri)
@@ -72,9 +74,24 @@ class LoversLabHandler(Handler, LoversLabAuthenticator, SimpleHttpDownloader):
             raise RuntimeError("Expected first request to return 200. "
                                "Instead got " + str(r.status_code))
 
-        for i in tqdm(range(0, 11), desc=filename + " timeout", unit="Sec"):
-            time.sleep(1)
-        super().download_file(filename, url, self.headers, filename)
+        # LoversLab makes us wait before the download starts. We only count it
+        # down if we have the terminal to ourselves
+        if progress is None:
+            for i in tqdm(
+                    range(0, 11),
+                    desc=filename + " timeout",
+                    unit="Sec"):
+                time.sleep(1)
+        else:
+            time.sleep(11)
+        super().download_file(
+            filename,
+            url,
+            self.headers,
+            filename,
+            progress,
+            hasher
+        )
 
     def check(self, uri):
         if super().needs_login():
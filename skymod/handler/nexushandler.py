@@ -34,11 +34,14 @@ class NexusHandler(Handler, NexusAuthenticator, SimpleHttpDownloader):
 
     def __init__(self):
         self.cfg = config.nexus
+        self.concurrency = self.cfg.concurrency
         super().__init__()
 
-    def fetch(self, uri, filename):
+    def login(self):
         if super().needs_login():
             super().perform_login(self.cfg, self.headers)
+
+    def fetch(self, uri, filename, progress=None, hasher=None):
         parts = urlparse(uri)
         mod_id = parts.netloc
 
@@ -53,7 +56,14 @@ class NexusHandler(Handler, NexusAuthenticator, SimpleHttpDownloader):
         if r.status_code != 200:
             raise RuntimeError("Failed downloading " + uri)
         j = r.json()
-        super().download_file(uri, j[0]["URI"], self.headers, filename)
+        super().download_file(
+            uri,
+            j[0]["URI"],
+            self.headers,
+            filename,
+            progress,
+            hasher
+        )
 
     def check(self, uri):
         if super().needs_login():
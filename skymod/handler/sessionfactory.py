@@ -14,14 +14,25 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import threading
+
 import requests
+from requests.cookies import RequestsCookieJar
 
 
+# A requests session isn't safe to share between threads, so every thread
+# gets a session of its own. They all share the one cookie jar (which does its
+# own locking), that way logging in on the main thread logs in the sessions
+# of the download workers as well.
 class SessionFactory(object):
     def __init__(self):
-        self._session = None
+        self._local = threading.local()
+        self._cookies = RequestsCookieJar()
 
     def getSession(self):
-        if self._session is None:
-            self._session = requests.Session()
-        return self._session
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.cookies = self._cookies
+            self._local.session = session
+        return session
@@ -22,5 +22,5 @@ class StubHandler(Handler):
         self.scheme = scheme
         self.message = message
 
-    def fetch(self, uri, filename):
+    def fetch(self, uri, filename, progress=None, hasher=None):
         raise Exception(self.message)
@@ -31,7 +31,9 @@ from skymod.package import (
 )
 from skymod.packagelist import InstalledTag, PackageList, WantedTag
 from skymod.repository import (
+    GitObjectPackageRepo,
     GitRemotePackageRepo,
+    LocalDbPackageRepo,
     LocalPackageRepo,
     Query
 )
@@ -40,8 +42,10 @@ from skymod.transaction import (
     ConflictError,
     DependencyBreakError,
     MissingDependencyError,
+    PlanCache,
     RemoveTransaction,
     TransactionCycleError,
+    UnsatisfiableDependencyError,
     UpgradeTransaction
 )
 
@@ -82,19 +86,14 @@ def clear():
 
     src_cache.clear()
 
+    PlanCache(cfg.cache.dir / "plans.json").clear()
+
 
 @cache.command()
 def size():
-    cache_dir = cfg.cache.dir
-    source_dir = cfg.source.dir
-
-    cache_size = 0
-    for f in cache_dir.walkfiles():
-        cache_size += f.size
-
-    source_size = 0
-    for f in source_dir.walkfiles():
-        source_size += f.size
+    # The maps keep track of their sizes, so we don't have to walk them
+    cache_size = Downloader(down_cache).size()
+    source_size = src_cache.total_size()
 
     print("{Style.BRIGHT}Cache: {Style.RESET_ALL} {}".format(
         humanize.naturalsize(cache_size, binary=True),
@@ -106,6 +105,20 @@ def size():
     ))
 
 
+# Remove everything that isn't needed by an installed package
+@cache.command()
+def gc():
+    init()
+
+    keep = local_repo.index.source_uris()
+    freed = downloader.retain(keep)
+    freed += src_cache.retain(keep)
+    print("Freed {Style.BRIGHT}{}{Style.RESET_ALL}".format(
+        humanize.naturalsize(freed, binary=True),
+        Style=Style
+    ))
+
+
 @cli.group()
 def config():
     pass
@@ -158,18 +171,33 @@ def init():
     organizer = MO(cfg)
 
     repo_dir = cfg.repo.dir
-    if not repo_dir.exists():
-        repo_dir.makedirs()
-    repo = GitRemotePackageRepo(
-        organizer,
-        repo_dir,
-        cfg.repo.url
-    )
+    if cfg.repo.backend == "objects":
+        # The mirror clone looks nothing like the checkout, so it lives next
+        # to it. That way switching backends leaves the other clone alone
+        repo = GitObjectPackageRepo(
+            organizer,
+            repo_dir + ".git",
+            cfg.repo.url,
+            cfg.repo.rev
+        )
+    else:
+        if not repo_dir.exists():
+            repo_dir.makedirs()
+        repo = GitRemotePackageRepo(
+            organizer,
+            repo_dir,
+            cfg.repo.url,
+            cfg.repo.depth,
+            cfg.repo.filter
+        )
 
     local_dir = cfg.local.dir
     if not local_dir.exists():
         local_dir.makedirs()
-    local_repo = LocalPackageRepo(organizer, local_dir)
+    if cfg.local.backend == "sqlite":
+        local_repo = LocalDbPackageRepo(organizer, local_dir)
+    else:
+        local_repo = LocalPackageRepo(organizer, local_dir)
 
 
 @cli.group()
@@ -255,7 +283,31 @@ def check(packages):
 @remote.command()
 def sync():
     print("Syncing remote repo")
-    repo.update()
+    changed = repo.update()
+    if changed is not None:
+        print("{} packages changed".format(len(changed)))
+
+
+# List the installed packages with a newer version in the remote repo. This
+# only compares the indexes, so nothing is loaded
+@remote.command()
+def outdated():
+    upgrades = local_repo.index.find_outdated(repo.index)
+    if not upgrades:
+        print("Everything is up to date")
+        return
+    for (installed, newer) in sorted(upgrades, key=lambda u: u[0].name):
+        print(
+            "{Style.BRIGHT}{}{Style.RESET_ALL} {} -> "
+            "{Fore.GREEN}{}{Fore.RESET}"
+            .format(
+                installed.name,
+                installed.version,
+                newer.version,
+                Style=Style,
+                Fore=Fore
+            )
+        )
 
 
 @remote.command()
@@ -319,10 +371,11 @@ def install(packages, explicit, upgrade, reason):
         # @ENHANCEMENT We should really run visualize on the graph that failed.
         # That would be way more helpful
         # -- We can't use asciinet since installing it is a pain
-        print("ERROR Cycle detected: ")
-        print("\tCycle consists of: {}".format(
-            ", ".join((p.name for p in e.cycle))
-        ))
+        print("ERROR Cycles detected: ")
+        for cycle in e.cycles:
+            print("\tCycle consists of: {}".format(
+                ", ".join((p.name for p in cycle))
+            ))
         exit(1)
     except ConflictError as e:
         # We found some conflicts which means we need to look for some package
@@ -362,6 +415,22 @@ def install(packages, explicit, upgrade, reason):
                 )
             )
         exit(1)
+    except UnsatisfiableDependencyError as e:
+        print(
+            "{Fore.RED}No version of {Style.BRIGHT}{}{Style.RESET_ALL}"
+            "{Fore.RED} satisfies all requirements{Fore.RESET}"
+            .format(e.name, Fore=Fore, Style=Style)
+        )
+        for requirement in e.requirements:
+            print(
+                "\t{Style.BRIGHT}{}{Style.RESET_ALL} requires "
+                "{Style.BRIGHT}{}{Style.RESET_ALL}"
+                .format(
+                    *requirement,
+                    Style=Style
+                )
+            )
+        exit(1)
 
     if not t.targets:
         print("Nothing to do".format(Style=Style, Fore=Fore))
@@ -580,32 +649,12 @@ def local_list(wanted):
 # operations
 @local.command()
 def visualize():
-    import networkx as nx
-    # How about we don't fire up a JVM just to start my script?
-    from asciinet import graph_to_ascii
-
-    G = nx.DiGraph()
-    root = "Root"
-
-    G.add_node(root)
-
     # @ENHANCEMENT
     # Right now we just visualize it as a stright up dependency graph. We might
     # want to show when we use provides instead in the future. This would
     # involve adding a fake node when we look for a provides and let that
     # depend on the actual implementors
-    for package in local_repo.get_all_packages():
-        G.add_node(package)
-        if package.reason == InstallReason.REQ:
-            G.add_edge(root, package)
-        for dep_str in package.dependecies:
-            q = Query(dep_str)
-            dep = local_repo.find_package(q)
-            if dep is None:
-                print(package, q)
-            G.add_edge(package, dep)
-
-    print(graph_to_ascii(G))
+    local_repo.graph.present()
 
 
 # Show details about a package
@@ -1,7 +1,5 @@
 import networkx as nx
 
-from skymod.repository import Query
-
 
 class MO(object):
     def __init__(self, config):
@@ -30,28 +28,18 @@ class MO(object):
     def make_profile(self, local_repo):
         modlist_path = self.cfg.profile_dir / "modlist.txt"
         with open(modlist_path, "w") as f:
-            G = nx.DiGraph()
-            for package in local_repo.get_all_packages():
-                G.add_node(package)
-                for dep_name in package.dependecies:
-                    q = Query(dep_name)
-                    dep = local_repo.find_package(q)
-
-                    if dep is None:
-                        # Skip mising dependecies. If we have an installed
-                        # package which has a not installed dependency, then we
-                        # just want to skip it. It's up to the user to make
-                        # sure everything is resolved, of course assisted by
-                        # the tool.  @COMPLETE it might be useful give the user
-                        # some way of doing a full dependency verification of
-                        # the local repo
-                        continue
-
-                    G.add_edge(package, dep)
-            for package in nx.lexicographical_topological_sort(
+            # Missing dependencies simply have no edge in the installed graph.
+            # If we have an installed package which has a not installed
+            # dependency, then we just want to skip it. It's up to the user to
+            # make sure everything is resolved, of course assisted by the
+            # tool.  @COMPLETE it might be useful give the user some way of
+            # doing a full dependency verification of the local repo
+            graph = local_repo.graph
+            G = graph.G.subgraph(graph.packages())
+            for name in nx.lexicographical_topological_sort(
                     G,
-                    key=lambda x: x.priority):
-                print("+" + package.name, file=f)
+                    key=graph.priority):
+                print("+" + name, file=f)
             print("*Unmanaged: Dawnguard", file=f)
             print("*Unmanaged: Dragonborn", file=f)
             print("*Unmanaged: HearthFires", file=f)
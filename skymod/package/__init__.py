@@ -16,9 +16,12 @@
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
 from .luaconfigproxy import LuaPackageConfigProxy
 from .version import Version
+from .versionrange import VersionRange
 from .localluaconfigproxy import LocalLuaPackageConfigProxy
 from .install_reason import InstallReason
 from .sourceline import SourceLine
+from .record import PackageRecord
+from .localrecord import LocalPackageRecord
 from .printer import print_local_package
 
 from skymod.config.runtimesandbox import RuntimeSandbox
@@ -32,6 +35,11 @@ def load_package(path, pkgsrc, pkgins):
     proxy = LuaPackageConfigProxy(path, config, pkgsrc, pkgins)
     return proxy
 
+def load_package_source(source, path, pkgsrc, pkgins):
+    config = _runtime.load_string(source, str(path))
+    proxy = LuaPackageConfigProxy(path, config, pkgsrc, pkgins, source=source)
+    return proxy
+
 def load_local_package(path, pkgsrc, pkgins, metadata_path):
     config = _runtime.load_file(path)
     with open(metadata_path, "r") as infile:
@@ -0,0 +1,52 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+from .install_reason import InstallReason
+from .record import PackageRecord
+
+
+# A record of an installed package. Besides the static fields it carries the
+# install metadata, so it can stand in for a LocalLuaPackageConfigProxy
+# everywhere we don't need to run the modbuild.
+class LocalPackageRecord(PackageRecord):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reason = InstallReason.DEP
+        self.install_date = None
+        self.priority = 0
+        self.pkgins = None
+
+    # The install metadata the index needs. The date stays with the package,
+    # nothing looks it up through the index
+    @classmethod
+    def from_dict(cls, d):
+        record = super().from_dict(d)
+        record.reason = InstallReason[d["reason"]]
+        record.priority = d["priority"]
+        return record
+
+    def to_dict(self):
+        d = super().to_dict()
+        d["reason"] = self.reason.name
+        d["priority"] = self.priority
+        return d
+
+    @property
+    def is_local(self):
+        return True
+
+    def __lt__(self, other):
+        return self.priority < other.priority
@@ -14,14 +14,19 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+from .provided import parse_provided
 from .sourceline import SourceLine
 from .version import Version
 
 
 class LuaPackageConfigProxy(object):
-    def __init__(self, path, config, pkgsrc, pkgins):
+    def __init__(self, path, config, pkgsrc, pkgins, source=None):
         self.path = path
+        # The modbuild itself, if it was loaded from memory rather than from
+        # the path
+        self.source = source
         self.config = config
+        self._provided = None
         self.pkgsrc = pkgsrc
         self.pkgins = pkgins / self.name
 
@@ -59,6 +64,17 @@ class LuaPackageConfigProxy(object):
             return []
         return [self.config.env.provides[i] for i in self.config.env.provides]
 
+    # The parsed provides, see parse_provided
+    @property
+    def provided(self):
+        if self._provided is None:
+            self._provided = parse_provided(
+                self.name,
+                self.version,
+                self.provides
+            )
+        return self._provided
+
     @property
     def sources(self):
         if not self.config.env.sources:
@@ -28,10 +28,10 @@ def print_local_package(local_repo, package):
     bridges = set()
     for (b1, b2) in package.bridges:
         p1 = local_repo.find_package(
-            skymod.repository.Query(b1)
+            skymod.repository.intern_query(b1)
         )
         p2 = local_repo.find_package(
-            skymod.repository.Query(b2)
+            skymod.repository.intern_query(b2)
         )
         if p1 and p2:
             bridges.add("{}--{}".format(p1, p2))
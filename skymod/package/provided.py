@@ -0,0 +1,37 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+from .version import Version
+
+
+# Everything a package can stand in for, as (name, version) pairs. A package
+# always provides itself at its own version, and that comes first. A provide
+# without a version is given a version of None, which satisfies any query. Only
+# the first mention of a name counts.
+def parse_provided(name, version, provides):
+    provided = [(name, version)]
+    seen = {name}
+    for p in provides:
+        provided_name, *rest = p.split("=")
+        if provided_name in seen:
+            continue
+        seen.add(provided_name)
+        try:
+            provided_version = Version(rest[0]) if rest else None
+        except ValueError:
+            raise ValueError("Malformed provides: {}".format(p))
+        provided.append((provided_name, provided_version))
+    return tuple(provided)
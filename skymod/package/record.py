@@ -0,0 +1,132 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+from .provided import parse_provided
+from .sourceline import SourceLine
+from .version import Version
+
+
+# A PackageRecord holds the static fields of a package, the ones that can be
+# read without running anything from the modbuild. It quacks like
+# a LuaPackageConfigProxy for everything a query or a resolver would look at,
+# but it's plain data, so we can store it in the index and throw it between
+# processes.
+class PackageRecord(object):
+    def __init__(
+        self,
+        key,
+        name,
+        version="1",
+        desc="",
+        depends=(),
+        provides=(),
+        conflicts=(),
+        bridges=(),
+        optdepends=(),
+        sources=(),
+    ):
+        # The key is the name of the directory the package lives in
+        self.key = key
+        self.name = name
+        self.version = Version(version)
+        self.desc = desc
+        self.dependecies = list(depends)
+        self.provides = list(provides)
+        self.conflicts = list(conflicts)
+        self.bridges = {(b1, b2) for (b1, b2) in bridges}
+        self.optdepends = [(o1, o2) for (o1, o2) in optdepends]
+        self.source_lines = list(sources)
+        self._provided = None
+
+    @classmethod
+    def from_package(cls, key, package):
+        return cls(
+            key,
+            package.name,
+            version=str(package.version),
+            desc=package.desc,
+            depends=package.dependecies,
+            provides=package.provides,
+            conflicts=package.conflicts,
+            bridges=package.bridges,
+            optdepends=package.optdepends,
+            sources=(str(s) for s in package.sources),
+        )
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d["key"],
+            d["name"],
+            version=d["version"],
+            desc=d["desc"],
+            depends=d["depends"],
+            provides=d["provides"],
+            conflicts=d["conflicts"],
+            bridges=d["bridges"],
+            optdepends=d["optdepends"],
+            sources=d["sources"],
+        )
+
+    def to_dict(self):
+        return {
+            "key": self.key,
+            "name": self.name,
+            "version": str(self.version),
+            "desc": self.desc,
+            "depends": self.dependecies,
+            "provides": self.provides,
+            "conflicts": self.conflicts,
+            # Sort the bridges to keep the file stable between writes
+            "bridges": sorted(list(b) for b in self.bridges),
+            "optdepends": [list(o) for o in self.optdepends],
+            "sources": self.source_lines,
+        }
+
+    # The parsed provides, see parse_provided. Parsed the first time anyone
+    # asks, so a bad version in the provides doesn't stop us from reading the
+    # record
+    @property
+    def provided(self):
+        if self._provided is None:
+            self._provided = parse_provided(
+                self.name,
+                self.version,
+                self.provides
+            )
+        return self._provided
+
+    @property
+    def sources(self):
+        return [SourceLine(s) for s in self.source_lines]
+
+    @property
+    def is_local(self):
+        return False
+
+    def __str__(self):
+        return "{}={}".format(self.name, self.version)
+
+    def __repr__(self):
+        return "<{}={}>".format(self.name, self.version)
+
+    def __eq__(self, other):
+        if type(other) == str:
+            return self.name == other
+        return self.name == other.name
+
+    def __hash__(self):
+        return self.name.__hash__()
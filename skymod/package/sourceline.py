@@ -14,16 +14,50 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+
 from path import Path
 
+# The hashes a source line can declare for its file
+CHECKSUM_ALGORITHMS = ("md5", "sha1", "sha224", "sha256", "sha384", "sha512")
+
+
+# "sha256=abc..." -> ("sha256", "abc...")
+def parse_checksum(string):
+    (algorithm, _, digest) = string.partition("=")
+    algorithm = algorithm.strip().lower()
+    digest = digest.strip().lower()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError("Unknown checksum algorithm {}".format(algorithm))
+    if len(digest) != hashlib.new(algorithm).digest_size * 2:
+        raise ValueError("Malformed {} checksum {}".format(algorithm, digest))
+    try:
+        int(digest, 16)
+    except ValueError:
+        raise ValueError("Malformed {} checksum {}".format(algorithm, digest))
+    return (algorithm, digest)
 
+
+# A source is written as uri::filename, optionally followed by a checksum of
+# the file like uri::filename::sha256=...
 class SourceLine(object):
     def __init__(self, string):
-        self.uri, filename = string.split("::")
-        self.filename = Path(filename)
+        parts = string.split("::")
+        if len(parts) not in (2, 3):
+            raise ValueError("Malformed source line {}".format(string))
+        self.uri = parts[0]
+        self.filename = Path(parts[1])
+        self.checksum = None
+        if len(parts) == 3:
+            self.checksum = parse_checksum(parts[2])
 
     def get_name(self):
         return self.filename.splitext()[0]
 
     def get_ext(self):
         return self.filename.splitext()[1]
+
+    def __str__(self):
+        if self.checksum is None:
+            return "{}::{}".format(self.uri, self.filename)
+        return "{}::{}::{}={}".format(self.uri, self.filename, *self.checksum)
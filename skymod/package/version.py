@@ -14,33 +14,53 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
-from functools import total_ordering
-
-
-@total_ordering
+# Versions are dotted lists of integers, compared part by part. A version that
+# is a prefix of another sorts before it, so 1.2 < 1.2.0 < 1.2.1. Versions are
+# immutable, which lets us keep the parts in a tuple and hash them once.
 class Version(object):
+    __slots__ = ("v", "_hash")
+
     def __init__(self, version_str):
-        self.v = [int(p) for p in version_str.split(".")]
+        self.v = tuple(int(p) for p in version_str.split("."))
+        self._hash = hash(self.v)
 
     def __lt__(self, other):
-        for k, v in enumerate(self.v):
-            if k >= len(other.v):
-                return False
-            if v < other.v[k]:
-                return True
-            if v > other.v[k]:
-                return False
-        if len(self.v) < len(other.v):
-            return True
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.v < other.v
+
+    def __le__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.v <= other.v
+
+    def __gt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.v > other.v
+
+    def __ge__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.v >= other.v
 
     def __eq__(self, other):
-        if len(self.v) != len(other.v):
-            return False
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.v == other.v
+
+    def __ne__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.v != other.v
+
+    def __hash__(self):
+        return self._hash
 
-        for k, v in enumerate(self.v):
-            if v != other.v[k]:
-                return False
-        return True
+    # Pickle as the plain version string. Records holding versions are shipped
+    # between processes when building the index
+    def __reduce__(self):
+        return (Version, (repr(self),))
 
     def __repr__(self):
         return ".".join(map(str, self.v))
@@ -0,0 +1,107 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+# An interval of versions. A bound of None means the range is open in that
+# direction, so VersionRange() is every version there is. Ranges are immutable,
+# narrowing one with intersect gives a new range.
+class VersionRange(object):
+    __slots__ = ("lower", "lower_inc", "upper", "upper_inc")
+
+    def __init__(self, lower=None, lower_inc=True, upper=None, upper_inc=True):
+        self.lower = lower
+        self.lower_inc = lower_inc
+        self.upper = upper
+        self.upper_inc = upper_inc
+
+    @classmethod
+    def exactly(cls, version):
+        return cls(version, True, version, True)
+
+    @property
+    def is_empty(self):
+        if self.lower is None or self.upper is None:
+            return False
+        if self.lower < self.upper:
+            return False
+        if self.lower == self.upper:
+            return not (self.lower_inc and self.upper_inc)
+        return True
+
+    # Provides without a version (None) are taken to satisfy any version, the
+    # same way Query treats them
+    def contains(self, version):
+        if version is None:
+            return True
+        if self.lower is not None:
+            if version < self.lower:
+                return False
+            if version == self.lower and not self.lower_inc:
+                return False
+        if self.upper is not None:
+            if version > self.upper:
+                return False
+            if version == self.upper and not self.upper_inc:
+                return False
+        return True
+
+    # Does the config provide name at a version within this range
+    def provides(self, config, name):
+        for (provided_name, version) in config.provided:
+            if provided_name == name:
+                return self.contains(version)
+        return False
+
+    def intersect(self, other):
+        lower, lower_inc = self.lower, self.lower_inc
+        if other.lower is not None:
+            if lower is None or other.lower > lower:
+                lower, lower_inc = other.lower, other.lower_inc
+            elif other.lower == lower:
+                lower_inc = lower_inc and other.lower_inc
+
+        upper, upper_inc = self.upper, self.upper_inc
+        if other.upper is not None:
+            if upper is None or other.upper < upper:
+                upper, upper_inc = other.upper, other.upper_inc
+            elif other.upper == upper:
+                upper_inc = upper_inc and other.upper_inc
+
+        return VersionRange(lower, lower_inc, upper, upper_inc)
+
+    def __eq__(self, other):
+        if not isinstance(other, VersionRange):
+            return NotImplemented
+        return (
+            (self.lower, self.lower_inc, self.upper, self.upper_inc) ==
+            (other.lower, other.lower_inc, other.upper, other.upper_inc)
+        )
+
+    def __hash__(self):
+        return hash((self.lower, self.lower_inc, self.upper, self.upper_inc))
+
+    def __repr__(self):
+        if self.is_empty:
+            return "<empty>"
+        if self.lower is not None and self.lower == self.upper:
+            return "={}".format(self.lower)
+        parts = []
+        if self.lower is not None:
+            op = ">=" if self.lower_inc else ">"
+            parts.append("{}{}".format(op, self.lower))
+        if self.upper is not None:
+            op = "<=" if self.upper_inc else "<"
+            parts.append("{}{}".format(op, self.upper))
+        return ",".join(parts) or "*"
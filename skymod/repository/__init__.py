@@ -14,6 +14,9 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+from .gitobjectrepo import GitObjectPackageRepo
 from .gitrepo import GitRemotePackageRepo
+from .index import BridgeIndex
+from .localdbrepo import LocalDbPackageRepo
 from .localrepo import LocalPackageRepo
-from .query import Query
+from .query import Query, intern_query
@@ -19,3 +19,9 @@ class MalformedQueryError(Exception):
 
 class AlreadyInstalledError(Exception):
     pass
+
+class RepoLayoutError(Exception):
+    pass
+
+class DivergedRepoError(Exception):
+    pass
@@ -0,0 +1,161 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import os
+
+import git
+
+import skymod.package
+from skymod.cfg import config as cfg
+
+from . import indexbuilder
+from .errors import RepoLayoutError
+from .gitrepo import TqdmUpTo
+from .packagerepo import PackageRepo
+
+
+# Index source reading the modbuilds of a git tree. Blobs are content
+# addressed, so the blob id is both the stamp and the digest.
+class GitTreeSource(object):
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def keys(self):
+        return self.blobs.keys()
+
+    def exists(self, key):
+        return key in self.blobs
+
+    def stamp(self, key):
+        return self.blobs[key]
+
+    def digest(self, key):
+        return self.blobs[key]
+
+
+# A package repo read straight out of the git object database, there's no
+# working tree at all. The repo is kept as a mirror clone and we resolve
+# packages against a single commit (HEAD by default, but any revision will
+# do). The blobs are streamed through the one cat-file process GitPython keeps
+# around, and the modbuilds are evaluated from memory.
+class GitObjectPackageRepo(PackageRepo):
+    def __init__(self, organizer, root, remote, rev="HEAD"):
+        if root.exists() and (root / ".git").exists():
+            raise RepoLayoutError(
+                "{} is a checkout for the worktree backend, the objects"
+                " backend needs a mirror clone".format(root)
+            )
+        if not root.exists() or not (root / "HEAD").exists():
+            if root.exists() and os.listdir(root):
+                raise RepoLayoutError(
+                    "Can't clone into {}, it isn't empty".format(root)
+                )
+            print("Cloning repo")
+            with TqdmUpTo(miniters=1) as bar:
+                self.repo = git.Repo.clone_from(
+                    remote,
+                    root,
+                    mirror=True,
+                    progress=bar.update_to
+                )
+        else:
+            self.repo = git.Repo(root)
+        self.rev = rev
+        self.commit = self.repo.rev_parse(rev).hexsha
+        self.blobs = self._list_modbuilds(self.commit)
+        super().__init__(
+            organizer,
+            root,
+            index_path=root / "skymod_index.json",
+            index_source=GitTreeSource(self.blobs)
+        )
+
+    # Map every package in the commit to the blob id of its modbuild
+    def _list_modbuilds(self, commit):
+        out = self.repo.git.ls_tree("-r", "-z", "--full-tree", commit)
+        blobs = {}
+        for entry in out.split("\0"):
+            if not entry:
+                continue
+            (info, path) = entry.split("\t", 1)
+            (_, type_, sha) = info.split(" ")
+            parts = path.split("/")
+            if type_ != "blob" or len(parts) != 2:
+                continue
+            if parts[1] != "modbuild.lua" or parts[0].startswith("."):
+                continue
+            blobs[parts[0]] = sha
+        return blobs
+
+    def _all_packages(self):
+        return (self.root / key for key in self.blobs.keys())
+
+    def _package_stamp(self, path):
+        return self.blobs[path.name]
+
+    def _load_package(self, path):
+        pkgins = self.organizer.getModsDir()
+        pkgsrc = cfg.source.dir
+        key = path.name
+        (_, _, _, source) = self.repo.git.get_object_data(self.blobs[key])
+        config = skymod.package.load_package_source(
+            source,
+            path / "modbuild.lua",
+            pkgsrc,
+            pkgins
+        )
+
+        return config
+
+    def _load_records(self, keys):
+        # The workers can't read from our cat-file, so read the blobs here and
+        # ship them along
+        workers = indexbuilder.worker_count(cfg.repo.index_workers)
+        if workers > 1 and len(keys) >= indexbuilder.PARALLEL_THRESHOLD:
+            items = []
+            for key in keys:
+                (_, _, _, source) = self.repo.git.get_object_data(
+                    self.blobs[key]
+                )
+                items.append((key, self.root / key / "modbuild.lua", source))
+            return indexbuilder.build_records(
+                items,
+                cfg.source.dir,
+                self.organizer.getModsDir(),
+                workers
+            )
+        return [self._try_load_record(key) for key in keys]
+
+    def revision(self):
+        return self.commit
+
+    def update(self):
+        old_blobs = self.blobs
+        with TqdmUpTo(miniters=1, total=100) as bar:
+            self.repo.remote().fetch(progress=bar.update_to)
+        self.commit = self.repo.rev_parse(self.rev).hexsha
+
+        # Swap the tree under the index and let it figure out what's new
+        self.blobs = self._list_modbuilds(self.commit)
+        self._index.source.blobs = self.blobs
+        self._proxies.clear()
+        self.reload_index()
+
+        changed = set(old_blobs.keys()) ^ set(self.blobs.keys())
+        for key, sha in self.blobs.items():
+            if key in old_blobs and old_blobs[key] != sha:
+                changed.add(key)
+        return changed
@@ -14,9 +14,12 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import os
+
 import git
 from tqdm import tqdm
 
+from .errors import DivergedRepoError, RepoLayoutError
 from .packagerepo import PackageRepo
 
 
@@ -36,21 +39,146 @@ class TqdmUpTo(tqdm):
         self.update(cur_count - self.n)
 
 
+# Turn a list of paths relative to the repo root into the keys of the packages
+# whose modbuild they point at
+def _package_keys(paths):
+    keys = set()
+    for path in paths:
+        parts = path.split("/")
+        if len(parts) != 2 or parts[1] != "modbuild.lua":
+            continue
+        if parts[0].startswith("."):
+            continue
+        keys.add(parts[0])
+    return keys
+
+
 class GitRemotePackageRepo(PackageRepo):
-    def __init__(self, organizer, root, remote):
+    # A depth above 0 makes a shallow clone with only that many commits of
+    # history. A filter (like "blob:none") makes a partial clone, where git only
+    # downloads the blobs it actually needs.
+    def __init__(self, organizer, root, remote, depth=0, filter_=""):
+        self.depth = depth
         if not root.exists() or not (root/".git").exists():
+            if root.exists() and (root / "HEAD").exists():
+                raise RepoLayoutError(
+                    "{} is a mirror clone for the objects backend, the"
+                    " worktree backend needs a checkout".format(root)
+                )
+            if root.exists() and os.listdir(root):
+                raise RepoLayoutError(
+                    "Can't clone into {}, it isn't empty".format(root)
+                )
             print("Cloning repo")
+            options = {}
+            if depth > 0:
+                options["depth"] = depth
+            if filter_:
+                options["filter"] = filter_
             with TqdmUpTo(miniters=1) as bar:
                 self.repo = git.Repo.clone_from(
                     remote,
                     root,
-                    progress=bar.update_to
+                    progress=bar.update_to,
+                    **options
                 )
         else:
             self.repo = git.Repo(root)
         self.remote = self.repo.remote()
-        super().__init__(organizer, root)
+        # Keep the index out of the working tree, we don't want it to show up
+        # as an untracked file
+        super().__init__(
+            organizer,
+            root,
+            index_path=root / ".git" / "skymod_index.json"
+        )
 
+    # The packages that changed between two commits. None if we can't tell,
+    # which happens if we don't know the old commit anymore
+    def _changed_since(self, old, new):
+        if old is None:
+            return None
+        if old == new:
+            return set()
+        try:
+            out = self.repo.git.diff("--name-only", "--no-renames", old, new)
+        except git.GitCommandError:
+            return None
+        return _package_keys(out.splitlines())
+
+    # The packages with uncommitted changes in the working tree
+    def _changed_in_worktree(self):
+        out = self.repo.git.status("--porcelain", "--untracked-files=all")
+        # Renames are written as "XY from -> to"
+        return _package_keys(
+            line[3:].split(" -> ")[-1] for line in out.splitlines()
+        )
+
+    # The index remembers which commit it was built from. Instead of checking
+    # every package we ask git what changed since then. Anything that was
+    # changed in the working tree last time is checked again, in case it was
+    # reverted.
+    def _refresh_index(self):
+        head = self.repo.head.commit.hexsha
+        worktree = self._changed_in_worktree()
+
+        keys = self._changed_since(self._index.state.get("commit"), head)
+        if keys is None:
+            self._index.refresh(self._load_records)
+        else:
+            keys |= set(self._index.state.get("worktree", []))
+            keys |= worktree
+            self._index.refresh_keys(keys, self._load_records)
+
+        self._index.set_state("commit", head)
+        self._index.set_state("worktree", sorted(worktree))
+
+    # The commit we are on, unless some of the packages were changed in the
+    # working tree. Then we have to look at the packages themselves
+    def revision(self):
+        index = self.index
+        if index.state.get("worktree"):
+            return index.digest()
+        return index.state["commit"]
+
+    # Only fetch the tip of the branch we are on, and fast forward to it
     def update(self):
+        old_head = self.repo.head.commit.hexsha
+
+        branch = self.repo.active_branch
+        tracking = branch.tracking_branch()
+        remote_head = tracking.remote_head if tracking else branch.name
+        # Where the remote was the last time we looked. If we are still on
+        # something we got from there, we have no commits of our own
+        last_remote = tracking.commit.hexsha if tracking else None
+        options = {}
+        if self.depth > 0:
+            options["depth"] = self.depth
         with TqdmUpTo(miniters=1, total=100) as bar:
-            self.remote.pull(progress=bar.update_to)
+            self.remote.fetch(remote_head, progress=bar.update_to, **options)
+
+        if self.repo.git.rev_parse("--is-shallow-repository") == "true":
+            # The fetched tip might not connect to the history we have, so git
+            # can't tell that it's a fast forward. It's safe to move to it
+            # anyway, as long as we don't have commits of our own that would
+            # be lost. The reset keeps any uncommitted changes (or refuses if
+            # they'd be lost)
+            own_commits = (
+                last_remote is None or
+                not self.repo.is_ancestor(old_head, last_remote)
+            )
+            if own_commits and not self.repo.is_ancestor(
+                    old_head, "FETCH_HEAD"):
+                raise DivergedRepoError(
+                    "The repo has commits that aren't on the remote,"
+                    " refusing to update"
+                )
+            self.repo.git.reset("--keep", "FETCH_HEAD")
+        else:
+            self.repo.git.merge("--ff-only", "FETCH_HEAD")
+        new_head = self.repo.head.commit.hexsha
+
+        # Reindex right away, the next command shouldn't pay for the sync
+        changed = self._changed_since(old_head, new_head)
+        self.reload_index()
+        return changed
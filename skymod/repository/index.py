@@ -0,0 +1,445 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import os
+
+from colorama import Fore, Style
+
+from skymod.package import PackageRecord
+
+from .errors import MalformedQueryError
+from .query import intern_query
+from .search import SearchIndex
+
+# Bump this whenever the layout of the records change. An index with another
+# version is thrown away and rebuilt from scratch
+INDEX_VERSION = 3
+
+
+# An entry for a modbuild we couldn't evaluate has no record, only the error
+class IndexEntry(object):
+    def __init__(self, stamp, digest, record, error=None):
+        self.stamp = stamp
+        self.digest = digest
+        self.record = record
+        self.error = error
+
+    @staticmethod
+    def from_dict(d, record_type=PackageRecord):
+        if d["record"] is None:
+            return IndexEntry(d["stamp"], d["digest"], None, d["error"])
+        return IndexEntry(
+            d["stamp"],
+            d["digest"],
+            record_type.from_dict(d["record"])
+        )
+
+    def to_dict(self):
+        if self.record is None:
+            return {
+                "stamp": self.stamp,
+                "digest": self.digest,
+                "record": None,
+                "error": self.error,
+            }
+        return {
+            "stamp": self.stamp,
+            "digest": self.digest,
+            "record": self.record.to_dict(),
+        }
+
+
+# An index source is how the index looks at the modbuilds it indexes. The
+# stamp is a cheap check for changes, while the digest is an expensive but
+# certain one. The FileSource reads them from a directory of package
+# directories, the stamp being the mtime and size of the modbuild.
+class FileSource(object):
+    def __init__(self, root):
+        self.root = root
+
+    def keys(self):
+        for d in self.root.dirs():
+            if d.name.startswith("."):
+                continue
+            if not (d / "modbuild.lua").exists():
+                continue
+            yield d.name
+
+    def exists(self, key):
+        return (self.root / key / "modbuild.lua").exists()
+
+    def stamp(self, key):
+        stat = (self.root / key / "modbuild.lua").stat()
+        # A list, since that's what we get back from the json
+        return [stat.st_mtime, stat.st_size]
+
+    def digest(self, key):
+        modbuild = self.root / key / "modbuild.lua"
+        return hashlib.sha1(modbuild.bytes()).hexdigest()
+
+
+# Bridges keyed by the unordered pair of names they bridge. Since a bridge is
+# written as two queries, we can find every bridge that could apply to two
+# packages by looking at the pairs of names the two packages provide. We still
+# have to check the queries, since they might have a version constraint.
+class BridgeIndex(object):
+    def __init__(self, packages=()):
+        # frozenset of names -> {key: (package, [(query, query)])}
+        self.pairs = {}
+        for package in packages:
+            self.add(package.name, package)
+
+    def add(self, key, package):
+        # Parse them all before adding any, so a malformed one leaves nothing
+        # behind
+        queries = [
+            (intern_query(b1), intern_query(b2))
+            for (b1, b2) in package.bridges
+        ]
+        for (q1, q2) in queries:
+            pair = frozenset((q1.name, q2.name))
+            bridges = self.pairs.setdefault(pair, {})
+            bridges.setdefault(key, (package, []))[1].append((q1, q2))
+
+    def remove(self, key, package):
+        for (b1, b2) in package.bridges:
+            pair = frozenset((intern_query(b1).name, intern_query(b2).name))
+            bridges = self.pairs.get(pair)
+            if bridges is None:
+                continue
+            bridges.pop(key, None)
+            if not bridges:
+                del self.pairs[pair]
+
+    def find(self, p1, p2, exclude=set()):
+        found = {}
+        for (n1, _) in p1.provided:
+            for (n2, _) in p2.provided:
+                bridges = self.pairs.get(frozenset((n1, n2)), {})
+                for key, (package, queries) in bridges.items():
+                    if key in found or package in exclude:
+                        continue
+                    for (q1, q2) in queries:
+                        if ((q1.matches(p1) and q2.matches(p2)) or
+                                (q2.matches(p1) and q1.matches(p2))):
+                            found[key] = package
+                            break
+        return found.values()
+
+
+# The PackageIndex is a persistent cache of the static fields of every package
+# in a repo. Evaluating a modbuild means firing up lua, so we only want to do
+# that when the file actually changed. We key on the package directory and
+# check the stamp from the source first. If that changed we fall back to
+# comparing the digest, since a git checkout happily touches files without
+# changing them.
+class PackageIndex(object):
+    def __init__(self, source, path, record_type=PackageRecord):
+        self.source = source
+        self.path = path
+        # What the records are loaded as, installed packages carry a bit more
+        self.record_type = record_type
+        self.entries = {}
+        # Free form bookkeeping for the repo owning the index, saved along
+        # with the entries
+        self.state = {}
+        self.dirty = False
+        # Provided name -> {key: (record, provided version)}
+        self.providers = {}
+        # Dependency name -> {key: (record, [dependency queries])}
+        self.dependants = {}
+        self.bridges = BridgeIndex()
+        # Key -> why, for the records we couldn't index
+        self.broken = {}
+        # Only built when someone searches, most commands never do
+        self._search = None
+        self._digest = None
+
+    def _index_record(self, record):
+        dependecies = [intern_query(d) for d in record.dependecies]
+        provided = record.provided
+        # The bridges go first, they check all their queries before adding
+        # anything. That way a malformed record never makes it into the maps
+        self.bridges.add(record.key, record)
+        for (name, version) in provided:
+            self.providers.setdefault(name, {})[record.key] = (record, version)
+        for q in dependecies:
+            deps = self.dependants.setdefault(q.name, {})
+            deps.setdefault(record.key, (record, []))[1].append(q)
+        if self._search is not None:
+            self._search.add(record)
+
+    # A record we can't index is kept in the entries, so we don't evaluate it
+    # again until it changes, but it doesn't go in any of the maps. Whoever
+    # asks for the package directly gets the error, just like if it had never
+    # been indexed, everything else carries on without it. A bad version in
+    # the provides gives a ValueError rather than a MalformedQueryError.
+    def _add_record(self, record):
+        try:
+            self._index_record(record)
+        except (MalformedQueryError, ValueError) as e:
+            if self._search is not None:
+                self._search.add(record)
+            self._mark_broken(record.key, str(e))
+
+    def _mark_broken(self, key, error):
+        self.broken[key] = error
+        print(
+            "{Fore.YELLOW}{Style.BRIGHT}Warning:{Style.RESET_ALL}"
+            " skipping {}: {}"
+            .format(key, error, Fore=Fore, Style=Style)
+        )
+
+    def _add_entry(self, key, entry):
+        if entry.record is None:
+            self._mark_broken(key, entry.error)
+        else:
+            self._add_record(entry.record)
+
+    def _unindex_record(self, record):
+        if self.broken.pop(record.key, None) is not None:
+            if self._search is not None:
+                self._search.remove(record)
+            return
+        for (name, _) in record.provided:
+            provs = self.providers.get(name)
+            if provs is None:
+                continue
+            provs.pop(record.key, None)
+            if not provs:
+                del self.providers[name]
+        for dep_str in record.dependecies:
+            name = intern_query(dep_str).name
+            deps = self.dependants.get(name)
+            if deps is None:
+                continue
+            deps.pop(record.key, None)
+            if not deps:
+                del self.dependants[name]
+        self.bridges.remove(record.key, record)
+        if self._search is not None:
+            self._search.remove(record)
+
+    # Forget every entry, without touching what's saved
+    def clear(self):
+        self.entries = {}
+        self.state = {}
+        self.providers = {}
+        self.dependants = {}
+        self.bridges = BridgeIndex()
+        self.broken = {}
+        self._search = None
+        self._digest = None
+
+    def load(self):
+        self.clear()
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r") as infile:
+                data = json.load(infile)
+        except ValueError:
+            # A broken index is no worse than a missing one
+            return
+        if data.get("version") != INDEX_VERSION:
+            return
+        self.entries = {
+            k: IndexEntry.from_dict(v, self.record_type)
+            for k, v in data["entries"].items()
+        }
+        for (key, entry) in self.entries.items():
+            self._add_entry(key, entry)
+        self.state = data.get("state", {})
+
+    def save(self):
+        if not self.dirty:
+            return
+        # Write to the side and move it in place, that way we never leave
+        # a half written index behind
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump({
+                "version": INDEX_VERSION,
+                "state": self.state,
+                "entries": {k: v.to_dict() for k, v in self.entries.items()},
+            }, outfile)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def _is_current(self, key, entry):
+        if entry is None:
+            return False
+        stamp = self.source.stamp(key)
+        if entry.stamp == stamp:
+            return True
+        if entry.digest != self.source.digest(key):
+            return False
+        # The file was touched but the content is the same
+        entry.stamp = stamp
+        self.dirty = True
+        return True
+
+    # Bring the index up to date with the files on disk. load_records is
+    # called with the keys of all the packages that needs to be (re)evaluated,
+    # and should return (key, record, error) triples for them. A package that
+    # failed to evaluate has no record, just the error, and is kept as broken
+    # until its modbuild changes
+    def refresh(self, load_records):
+        keys = set(self.source.keys()) | set(self.entries.keys())
+        self.refresh_keys(keys, load_records)
+
+    # Like refresh, but only look at the given packages. This is for when we
+    # know what changed, and don't want to stat the entire repo to find out
+    def refresh_keys(self, keys, load_records):
+        stale = []
+        for key in keys:
+            if not self.source.exists(key):
+                self.remove(key)
+                continue
+            if self._is_current(key, self.entries.get(key)):
+                continue
+            stale.append(key)
+
+        if not stale:
+            return
+        for (key, record, error) in load_records(stale):
+            if record is None:
+                self.update_broken(key, error)
+            else:
+                self.update(key, record)
+
+    def set_state(self, key, value):
+        if self.state.get(key) == value:
+            return
+        self.state[key] = value
+        self.dirty = True
+
+    def update(self, key, record):
+        self._update(key, IndexEntry(
+            self.source.stamp(key),
+            self.source.digest(key),
+            record
+        ))
+
+    # Remember that the package at key couldn't be evaluated
+    def update_broken(self, key, error):
+        self._update(key, IndexEntry(
+            self.source.stamp(key),
+            self.source.digest(key),
+            None,
+            error
+        ))
+
+    def _update(self, key, entry):
+        self.remove(key)
+        self._add_entry(key, entry)
+        self.entries[key] = entry
+        self.dirty = True
+        self._digest = None
+
+    def remove(self, key):
+        if key not in self.entries:
+            return
+        entry = self.entries.pop(key)
+        if entry.record is None:
+            self.broken.pop(key, None)
+        else:
+            self._unindex_record(entry.record)
+        self.dirty = True
+        self._digest = None
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return entry.record
+
+    # Join with another index on the package name, giving every record here
+    # that has a newer version over there as (record, newer record). Only the
+    # given keys are looked at, if any are given
+    def find_outdated(self, other, keys=None):
+        if keys is None:
+            keys = self.entries.keys()
+        outdated = []
+        for key in keys:
+            record = self.get(key)
+            if record is None:
+                continue
+            newer = other.get(record.name)
+            if newer is not None and newer.version > record.version:
+                outdated.append((record, newer))
+        return outdated
+
+    # All the (record, version) pairs that provide the given name
+    def find_providers(self, name):
+        return self.providers.get(name, {}).values()
+
+    # All the records satisfying one of the dependencies of the given package
+    def find_dependencies(self, package):
+        found = {}
+        for dep_str in package.dependecies:
+            q = intern_query(dep_str)
+            for (record, version) in self.find_providers(q.name):
+                if record != package and q.matches_version(version):
+                    found[record.key] = record
+        return found.values()
+
+    # All the records with a dependency the given package satisfies. We only
+    # have to look at the dependencies on the names the package provides
+    def find_dependants(self, package):
+        found = {}
+        for (name, _) in package.provided:
+            for (record, queries) in self.dependants.get(name, {}).values():
+                if any(q.matches(package) for q in queries):
+                    found[record.key] = record
+        return found.values()
+
+    # All the records that bridge a conflict between the two packages
+    def find_bridges(self, p1, p2, exclude=set()):
+        return self.bridges.find(p1, p2, exclude)
+
+    def search(self, terms, limit=10):
+        if self._search is None:
+            self._search = SearchIndex(self.records())
+        return self._search.search(terms, limit)
+
+    # A digest of every record in the index. Anything computed from the index
+    # can be cached under it, since it changes whenever a record does
+    def digest(self):
+        if self._digest is None:
+            h = hashlib.sha1()
+            for key in sorted(self.entries.keys()):
+                record = self.entries[key].record
+                if record is not None:
+                    record = record.to_dict()
+                h.update(json.dumps([key, record], sort_keys=True).encode())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    # Every source uri any of the records refer to
+    def source_uris(self):
+        return {s.uri for r in self.records() for s in r.sources}
+
+    def records(self):
+        return (
+            e.record for e in self.entries.values()
+            if e.record is not None
+        )
+
+    def __len__(self):
+        return len(self.entries)
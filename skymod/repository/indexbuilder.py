@@ -0,0 +1,89 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import skymod.package
+
+# Starting the workers isn't free, so only go parallel when there's enough to
+# do to make up for it
+PARALLEL_THRESHOLD = 64
+
+
+def _build_record(key, path, source, pkgsrc, pkgins):
+    if source is None:
+        package = skymod.package.load_package(path, pkgsrc, pkgins)
+    else:
+        package = skymod.package.load_package_source(
+            source,
+            path,
+            pkgsrc,
+            pkgins
+        )
+    return skymod.package.PackageRecord.from_package(key, package)
+
+
+# Runs in the worker. Every worker process has its own lua runtime (the one
+# made when skymod.package is imported), so they don't step on each other. We
+# send back (key, dict, error) triples, since those are cheap to pickle. Each
+# item is a (key, path, source) tuple, if the source is None the modbuild is
+# read from the path. A package that fails only takes itself out, not the
+# rest of the chunk.
+def _build_chunk(items, pkgsrc, pkgins):
+    records = []
+    for (key, path, source) in items:
+        try:
+            record = _build_record(key, path, source, pkgsrc, pkgins)
+        except Exception as e:
+            records.append((key, None, str(e)))
+            continue
+        records.append((key, record.to_dict(), None))
+    return records
+
+
+def _chunks(items, n):
+    size = max(1, -(-len(items) // n))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def worker_count(configured):
+    if configured > 0:
+        return configured
+    return os.cpu_count() or 1
+
+
+# Evaluate the packages in a process pool and return (key, record, error)
+# triples, like PackageRepo._load_records. Meant for building an index from
+# scratch, where every package in the repo has to go through lua.
+def build_records(items, pkgsrc, pkgins, workers):
+    items = list(items)
+    # Hand out a few chunks per worker to even out the slow packages
+    chunks = _chunks(items, workers * 4)
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_build_chunk, chunk, pkgsrc, pkgins)
+            for chunk in chunks
+        ]
+        for future in futures:
+            for (key, d, error) in future.result():
+                if d is None:
+                    records.append((key, None, error))
+                    continue
+                record = skymod.package.PackageRecord.from_dict(d)
+                records.append((key, record, None))
+    return records
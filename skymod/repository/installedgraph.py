@@ -0,0 +1,59 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+
+# Gives a local repo an InstalledGraph saved next to the packages. The graph
+# is checked against the index when it's loaded, and rebuilt if anything
+# changed behind our back. The repo calls _graph_add and _graph_remove as
+# packages come and go, and the graph is written out when the repo is saved.
+class InstalledGraphMixin(object):
+    _graph = None
+    _graph_dirty = False
+
+    @property
+    def _graph_path(self):
+        return self.root / ".graph.json"
+
+    @property
+    def graph(self):
+        # Imported here, since skymod.graph.installed imports skymod.package,
+        # which in turn imports the repositories
+        from skymod.graph.installed import InstalledGraph
+        if self._graph is None:
+            graph = InstalledGraph.load(self._graph_path)
+            if graph is None or not graph.is_current(self.index):
+                graph = InstalledGraph.from_index(self.index)
+                graph.save(self._graph_path)
+            self._graph = graph
+        return self._graph
+
+    def _graph_add(self, record):
+        self.graph.add(record, self.index)
+        self._graph_dirty = True
+
+    def _graph_remove(self, name):
+        self.graph.remove(name)
+        self._graph_dirty = True
+
+    # Write out everything add_package and remove_package changed. A
+    # transaction calls this once when it's done, rather than us rewriting
+    # the whole graph for every package. Should we die before then the graph
+    # no longer matches the index, and is rebuilt the next time it's loaded
+    def save(self):
+        if not self._graph_dirty:
+            return
+        self.graph.save(self._graph_path)
+        self._graph_dirty = False
@@ -0,0 +1,228 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import sqlite3
+from datetime import datetime
+
+import skymod.package
+from skymod.cfg import config as cfg
+from skymod.package import LocalPackageRecord
+
+from .errors import AlreadyInstalledError
+from .installedgraph import InstalledGraphMixin
+from .localrepo import LocalPackageRepo
+from .packagerepo import PackageRepo
+
+# Bump when the schema changes, and teach _create_schema how to get there
+SCHEMA_VERSION = 1
+
+
+# The database is the only source of truth, so the index never has to check
+# anything against it
+class DatabaseSource(object):
+    def keys(self):
+        return []
+
+    def exists(self, key):
+        return True
+
+    def stamp(self, key):
+        return None
+
+    def digest(self, key):
+        return None
+
+
+# A local repo kept in a single sqlite database instead of a directory per
+# package. Every installed package is a row with its static fields and install
+# metadata, so listing or querying the installed set never touches lua. The
+# modbuild itself is kept around in case someone needs to run it.
+class LocalDbPackageRepo(InstalledGraphMixin, PackageRepo):
+    record_type = LocalPackageRecord
+
+    def __init__(self, organizer, root):
+        super().__init__(organizer, root, index_source=DatabaseSource())
+        self.db = sqlite3.connect(root / "local.db")
+        self._create_schema()
+
+    # The schema is created and the old packages moved in as one transaction,
+    # and the version is only bumped at the end of it. If the migration fails
+    # we are left with the database we started with, and the next run tries
+    # again, instead of finding an empty database and thinking nothing is
+    # installed.
+    def _create_schema(self):
+        (version, ) = self.db.execute("PRAGMA user_version").fetchone()
+        if version == SCHEMA_VERSION:
+            return
+        with self.db:
+            # sqlite3 doesn't start a transaction by itself for a CREATE, so
+            # we have to do it ourselves
+            self.db.execute("BEGIN")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS packages (
+                    name TEXT PRIMARY KEY,
+                    record TEXT NOT NULL,
+                    source BLOB NOT NULL,
+                    reason TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    install_date REAL NOT NULL
+                )
+            """)
+            migrated = self._migrate()
+            self.db.execute(
+                "PRAGMA user_version = {}".format(SCHEMA_VERSION)
+            )
+        self._move_migrated(migrated)
+
+    # Copy packages installed in the old directory layout into the database.
+    # Returns the packages copied, to be moved aside once the database is
+    # committed
+    def _migrate(self):
+        old_repo = LocalPackageRepo(self.organizer, self.root)
+        packages = old_repo.get_all_packages()
+        if not packages:
+            return packages
+
+        print("Migrating {} installed packages".format(len(packages)))
+        for package in packages:
+            self._insert(
+                package,
+                package.reason,
+                package.priority,
+                package.install_date
+            )
+        return packages
+
+    # The old directories are moved aside rather than deleted, just in case
+    def _move_migrated(self, packages):
+        if not packages:
+            return
+        backup = self.root / ".migrated"
+        if not backup.exists():
+            backup.makedirs()
+        for package in packages:
+            (self.root / package.name).move(backup / package.name)
+        old_index = self.root / ".index.json"
+        if old_index.exists():
+            old_index.move(backup / old_index.name)
+
+    def _insert(self, package, reason, priority, install_date):
+        if package.source is not None:
+            source = package.source
+        else:
+            source = package.path.bytes()
+        record = skymod.package.PackageRecord.from_package(
+            package.name,
+            package
+        )
+        self.db.execute(
+            "INSERT INTO packages "
+            "(name, record, source, reason, priority, install_date) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                package.name,
+                json.dumps(record.to_dict()),
+                source,
+                reason.name,
+                priority,
+                install_date.timestamp(),
+            )
+        )
+
+    def _make_record(self, row):
+        (record, reason, priority, install_date) = row
+        d = json.loads(record)
+        d["reason"] = reason
+        d["priority"] = priority
+        record = self.record_type.from_dict(d)
+        record.install_date = datetime.fromtimestamp(install_date)
+        record.pkgins = self.organizer.getModsDir() / record.name
+        return record
+
+    # The index is built from the table every time, and never saved. The
+    # database is what's kept, so there is nothing for the index to catch up
+    # on
+    @property
+    def index(self):
+        if not self._index_loaded:
+            self._index.clear()
+            rows = self.db.execute(
+                "SELECT record, reason, priority, install_date FROM packages"
+            )
+            for row in rows:
+                record = self._make_record(row)
+                self._index.update(record.key, record)
+            self._index.dirty = False
+            self._index_loaded = True
+        return self._index
+
+    # Only needed to run the modbuild, everything else is answered by the
+    # records
+    def _load_package(self, path):
+        row = self.db.execute(
+            "SELECT source FROM packages WHERE name = ?",
+            (path.name, )
+        ).fetchone()
+        if row is None:
+            return None
+        return skymod.package.load_package_source(
+            row[0],
+            path / "modbuild.lua",
+            cfg.source.dir,
+            self.organizer.getModsDir()
+        )
+
+    # Installed packages are handed out as the records themselves, there is
+    # no modbuild on disk to load a proxy from. A record has everything the
+    # transactions and the printer ask an installed package for (the static
+    # fields, the install metadata and pkgins), but none of the lua side:
+    # there is no config, pkgsrc, path or source. Anything that needs to run
+    # the modbuild of an installed package has to go through _load_package.
+    def _package_from_record(self, record):
+        return record
+
+    def add_package(self, reason, package):
+        try:
+            with self.db:
+                self._insert(package, reason, 0, datetime.now())
+        except sqlite3.IntegrityError:
+            raise AlreadyInstalledError(
+                "Package already installed " + package.name
+            )
+
+        row = self.db.execute(
+            "SELECT record, reason, priority, install_date FROM packages "
+            "WHERE name = ?",
+            (package.name, )
+        ).fetchone()
+        record = self._make_record(row)
+        self.index.update(record.key, record)
+        self._graph_add(record)
+
+    def remove_package(self, package):
+        with self.db:
+            cursor = self.db.execute(
+                "DELETE FROM packages WHERE name = ?",
+                (package.name, )
+            )
+        if cursor.rowcount == 0:
+            raise AlreadyInstalledError("Package not installed")
+        self.index.remove(package.name)
+        self._graph_remove(package.name)
+
+    def get_all_packages(self):
+        return set(self.index.records())
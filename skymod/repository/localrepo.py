@@ -14,20 +14,41 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
 from datetime import datetime
 
 import yaml
 
 import skymod.package
 from skymod.cfg import config as cfg
+from skymod.package import InstallReason, LocalPackageRecord
 
 from .errors import AlreadyInstalledError
+from .index import FileSource
+from .installedgraph import InstalledGraphMixin
 from .packagerepo import PackageRepo
 
 
-class LocalPackageRepo(PackageRepo):
+# The index keeps the install reason and priority from the meta.yml along
+# with the modbuild fields, so a change to either has to be noticed
+class LocalFileSource(FileSource):
+    def stamp(self, key):
+        stamp = super().stamp(key)
+        stat = (self.root / key / "meta.yml").stat()
+        return stamp + [stat.st_mtime, stat.st_size]
+
+    def digest(self, key):
+        h = hashlib.sha1()
+        h.update((self.root / key / "modbuild.lua").bytes())
+        h.update((self.root / key / "meta.yml").bytes())
+        return h.hexdigest()
+
+
+class LocalPackageRepo(InstalledGraphMixin, PackageRepo):
+    record_type = LocalPackageRecord
+
     def __init__(self, organizer, root):
-        super().__init__(organizer, root)
+        super().__init__(organizer, root, index_source=LocalFileSource(root))
 
     def _load_package(self, path):
         pkgins = self.organizer.getModsDir()
@@ -42,13 +63,41 @@ class LocalPackageRepo(PackageRepo):
 
         return config
 
+    def _package_stamp(self, path):
+        return (super()._package_stamp(path), (path / "meta.yml").mtime)
+
+    # The index keeps the install reason and priority along with the static
+    # fields, so planning a removal doesn't have to load every package
+    def _add_metadata(self, key, record):
+        with open(self.root / key / "meta.yml", "r") as infile:
+            metadata = yaml.load(infile)
+        d = record.to_dict()
+        d["reason"] = InstallReason(metadata["reason"]).name
+        d["priority"] = metadata.get("priority", 0)
+        return self.record_type.from_dict(d)
+
+    def _load_records(self, keys):
+        records = []
+        for (key, record, error) in super()._load_records(keys):
+            if record is not None:
+                try:
+                    record = self._add_metadata(key, record)
+                except Exception as e:
+                    (record, error) = (None, str(e))
+            records.append((key, record, error))
+        return records
+
     def add_package(self, reason, package):
         package_dir = self.root / package.name
         if package_dir.exists():
             raise AlreadyInstalledError("Package already installed " + package.name)
         package_dir.makedirs()
+        self._proxies.invalidate(package_dir)
 
-        package.path.copy(package_dir)
+        if package.source is not None:
+            (package_dir / "modbuild.lua").write_bytes(package.source)
+        else:
+            package.path.copy(package_dir)
 
         with open(package_dir / "meta.yml", "w") as outfile:
             yaml.dump({
@@ -56,16 +105,32 @@ class LocalPackageRepo(PackageRepo):
                 "reason": reason.value,
             }, outfile)
 
+        record = self.record_type.from_package(package.name, package)
+        record.reason = reason
+        self.index.update(package.name, record)
+        self._graph_add(record)
+
     def remove_package(self, package):
         package_dir = self.root / package.name
         if not package_dir.exists():
             raise AlreadyInstalledError("Package not installed")
         package_dir.rmtree()
+        self._proxies.invalidate(package_dir)
+
+        self.index.remove(package.name)
+        self._graph_remove(package.name)
+
+    # The index and the graph are only written when asked, see
+    # InstalledGraphMixin.save. The packages themselves are on disk already,
+    # so an index that wasn't saved is just refreshed on the next run
+    def save(self):
+        self.index.save()
+        super().save()
 
     def get_all_packages(self):
         files = set() 
         for p in self.root.dirs():
             if p.name.startswith("."):
                 continue
-            files.add(self._load_package(p))
+            files.add(self._get_package(p))
         return files
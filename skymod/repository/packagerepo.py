@@ -14,18 +14,28 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
-from fuzzywuzzy import process
-
 import skymod.package
 from skymod.cfg import config as cfg
+from skymod.package import PackageRecord
 
-from .query import Query
+from . import indexbuilder
+from .index import FileSource, PackageIndex
+from .proxycache import ProxyCache
 
 
 class PackageRepo(object):
-    def __init__(self, organizer, root):
+    record_type = PackageRecord
+
+    def __init__(self, organizer, root, index_path=None, index_source=None):
         self.root = root
         self.organizer = organizer
+        self._index = PackageIndex(
+            index_source or FileSource(root),
+            index_path or root / ".index.json",
+            self.record_type
+        )
+        self._index_loaded = False
+        self._proxies = ProxyCache()
 
     def _load_package(self, path):
         pkgins = self.organizer.getModsDir()
@@ -36,82 +46,119 @@ class PackageRepo(object):
 
         return config
 
+    # Whatever changes when the files of a package changes
+    def _package_stamp(self, path):
+        return (path / "modbuild.lua").mtime
+
+    # Same as _load_package, except we reuse a package we've already loaded if
+    # it's still current
+    def _get_package(self, path):
+        stamp = self._package_stamp(path)
+        package = self._proxies.get(path, stamp)
+        if package is None:
+            package = self._load_package(path)
+            self._proxies.put(path, stamp, package)
+        return package
+
+    def _load_record(self, key):
+        package = self._get_package(self.root / key)
+        return skymod.package.PackageRecord.from_package(key, package)
+
+    # The modbuilds are written by people, so anything can go wrong
+    # evaluating them. We hand back the error instead of the record for the
+    # ones that fail, and let the index carry on without them
+    def _try_load_record(self, key):
+        try:
+            return (key, self._load_record(key), None)
+        except Exception as e:
+            return (key, None, str(e))
+
+    def _load_records(self, keys):
+        workers = indexbuilder.worker_count(cfg.repo.index_workers)
+        if workers > 1 and len(keys) >= indexbuilder.PARALLEL_THRESHOLD:
+            return indexbuilder.build_records(
+                [(key, self.root / key / "modbuild.lua", None) for key in keys],
+                cfg.source.dir,
+                self.organizer.getModsDir(),
+                workers
+            )
+        return [self._try_load_record(key) for key in keys]
+
+    # The index is loaded and brought up to date the first time anyone needs
+    # it. After that we trust it for the rest of the run, anything that changes
+    # the repo is expected to keep it updated.
+    @property
+    def index(self):
+        if not self._index_loaded:
+            self._index.load()
+            self._refresh_index()
+            self._index.save()
+            self._index_loaded = True
+        return self._index
+
+    # Figure out what changed since the index was saved. Without any other
+    # information we have to look at every package
+    def _refresh_index(self):
+        self._index.refresh(self._load_records)
+
+    # Throw away the in memory index, and bring it up to date again
+    def reload_index(self):
+        self._index_loaded = False
+        return self.index
+
+    # Identifies the state of the repo, anything resolved against the repo
+    # stays valid for as long as this doesn't change
+    def revision(self):
+        return self.index.digest()
+
     def _all_packages(self):
         return filter(
             lambda e: not e.name.startswith("."),
             self.root.dirs()
         )
 
+    def _package_from_record(self, record):
+        return self._get_package(self.root / record.key)
+
     def find_literal(self, query):
-        package_dir = self.root / query.name
-        if not package_dir.exists():
+        record = self.index.get(query.name)
+        if record is None:
             return None
-        config = self._load_package(package_dir)
-        if config is None:
-            return None
-        if query.matches(config):
-            return config
+        if query.matches(record):
+            return self._package_from_record(record)
         return None
 
     def _find_provider(self, query, exclude):
         candidates = set()
-        for p in self._all_packages():
-            candidate = self._load_package(p)
-            if candidate is None or candidate in exclude:
+        for (record, version) in self.index.find_providers(query.name):
+            if record in exclude:
                 continue
-            if query.matches(candidate):
+            if query.matches_version(version):
                 # @ENHANCEMENT This is a nice debug thing, but it clutters
                 # a lot.  Maybe we can find some way of having this only when
                 # we install something new
                 # print("{} provides {}".format(
                 #     Style.BRIGHT + str(candidate) + Style.RESET_ALL,
                 #     Style.BRIGHT + str(query) + Style.RESET_ALL))
-                candidates.add(candidate)
+                candidates.add(self._package_from_record(record))
         return candidates
 
+    # Searching is done entirely on the index, we hand back the records
+    # without loading anything
     def search(self, terms):
-        return [
-            self._load_package(e[0]) for e in
-                process.extractBests(
-                    terms,
-                    self._all_packages(),
-                    score_cutoff=10,
-                    limit=10
-                )
-        ]
-
-    def _does_depend(self, p1, p2):
-        for dep_query in p1.dependecies:
-            q = Query(dep_query)
-            if q.matches(p2):
-                return True
-        return False
+        return self.index.search(terms)
 
     def find_bridges(self, p1, p2, exclude=set()):
-        bridges = set()
-        for p in self._all_packages():
-            candidate = self._load_package(p)
-
-            if candidate in exclude:
-                continue
-
-            for bridge in candidate.bridges:
-                b1 = Query(bridge[0])
-                b2 = Query(bridge[1])
-                if b1.matches(p1) and b2.matches(p2):
-                    bridges.add(candidate)
-                elif b2.matches(p1) and b1.matches(p2):
-                    bridges.add(candidate)
-        return bridges
+        return {
+            self._package_from_record(record)
+            for record in self.index.find_bridges(p1, p2, exclude)
+        }
 
     def find_dependants(self, package):
-        dep = []
-        for p in self._all_packages():
-            candidate = self._load_package(p)
-            if self._does_depend(candidate, package):
-                dep.append(candidate)
-                continue
-        return dep
+        return [
+            self._package_from_record(record)
+            for record in self.index.find_dependants(package)
+        ]
 
     def find_package(self, query, exclude=set()):
         matches = self.find_packages(query, exclude=exclude)
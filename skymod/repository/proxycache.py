@@ -0,0 +1,51 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+from collections import OrderedDict
+
+
+# A small LRU of loaded packages. Loading a package means evaluating lua, and
+# the same package tends to get looked up again and again during a single
+# transaction. Every entry carries a stamp (usually some mtimes) which has to
+# match for the entry to be used, that way we never hand out a package for
+# a file that changed under us.
+class ProxyCache(object):
+    def __init__(self, size=1024):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, key, stamp):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        (entry_stamp, package) = entry
+        if entry_stamp != stamp:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return package
+
+    def put(self, key, stamp, package):
+        self.entries[key] = (stamp, package)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
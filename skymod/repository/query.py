@@ -14,10 +14,13 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import operator
 import re
 from enum import Enum
 
-from skymod.package import Version
+from skymod.package import Version, VersionRange
+
+from .errors import MalformedQueryError
 
 query_re = re.compile("(?P<name>[a-zA-Z0-9-_]{2,})(?:(?P<compar>[<>]=?|=)(?P<version>[0-9.]+))?$")
 
@@ -30,11 +33,36 @@ class Mod(Enum):
     EQ = "="
 
 
+_comparators = {
+    Mod.LT: operator.lt,
+    Mod.LE: operator.le,
+    Mod.GT: operator.gt,
+    Mod.GE: operator.ge,
+    Mod.EQ: operator.eq,
+}
+
+
+def _to_range(mod, version):
+    if mod == Mod.ANY:
+        return VersionRange()
+    if mod == Mod.EQ:
+        return VersionRange.exactly(version)
+    if mod in (Mod.LT, Mod.LE):
+        return VersionRange(upper=version, upper_inc=mod == Mod.LE)
+    return VersionRange(lower=version, lower_inc=mod == Mod.GE)
+
+
+# Queries are immutable once parsed, which means they can be hashed and shared.
+# Use intern_query to get one, unless you really need a fresh copy.
 class Query(object):
+    __slots__ = ("name", "version", "mod", "range", "_cmp", "_key")
+
     def __init__(self, target_str):
         match = query_re.match(target_str)
         if match == None:
-            raise MalformedQueryError("Query did not conform")
+            raise MalformedQueryError(
+                "Query did not conform: {}".format(target_str)
+            )
         self.name = match.group("name")
         version_str = match.group("version")
         self.version = Version(version_str) if version_str != None else None
@@ -50,35 +78,51 @@ class Query(object):
             }[match.group("compar")]
         except KeyError:
             raise
+        self.range = _to_range(self.mod, self.version)
+        self._cmp = _comparators.get(self.mod)
+        self._key = (self.name, self.mod, version_str)
 
     def _ver_match(self, version):
-        if self.mod == Mod.ANY:
+        if self._cmp is None:
             return True
-        elif self.mod == Mod.LT:
-            return version < self.version
-        elif self.mod == Mod.LE:
-            return version <= self.version
-        elif self.mod == Mod.GT:
-            return version > self.version
-        elif self.mod == Mod.GE:
-            return version >= self.version
-        elif self.mod == Mod.EQ:
-            return version == self.version
-        else:
-            raise Exception("Unknown version mod")
+        return self._cmp(version, self.version)
 
-    def matches(self, config):
-        if self.name == config.name:
-            return self._ver_match(config.version)
+    # Check a version someone provides this query name at. Provides without
+    # a version (None) are taken to satisfy any version
+    def matches_version(self, version):
+        if version is None:
+            return True
+        return self._ver_match(version)
 
-        for p in config.provides:
-            name, *rest = p.split("=")
-            ver = rest[0] if rest else None
+    def matches(self, config):
+        # The package itself is always the first thing provided, so this also
+        # covers matching on the name
+        for (name, version) in config.provided:
             if name == self.name:
-                if ver == None:
-                    return True
-                return self._ver_match(Version(ver))
+                return self.matches_version(version)
         return False
 
+    def __eq__(self, other):
+        if not isinstance(other, Query):
+            return NotImplemented
+        return self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
     def __repr__(self):
         return "{}{}{}".format(self.name, self.mod.value or "", self.version or "")
+
+
+_interned = {}
+
+
+# Parse a query string, reusing the query if we've seen the string before.
+# Dependency strings are repeated all over the repo, so this saves a lot of
+# parsing in the resolver loops
+def intern_query(target_str):
+    query = _interned.get(target_str)
+    if query is None:
+        query = Query(target_str)
+        _interned[target_str] = query
+    return query
@@ -0,0 +1,108 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+_word_re = re.compile("[a-z0-9]+")
+
+# How much a gram counts depending on where we found it. Hitting the name is
+# worth more than hitting the description
+NAME_WEIGHT = 1.0
+PROVIDES_WEIGHT = 0.8
+DESC_WEIGHT = 0.5
+
+# Results scoring below this (out of 1) are not worth showing
+SCORE_CUTOFF = 0.1
+
+
+# Words are padded so short words and the start of words still make grams.
+# Descriptions reuse a lot of words, so remembering them makes building the
+# index a lot faster
+@lru_cache(maxsize=16384)
+def _word_trigrams(word):
+    padded = "  " + word + " "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+# Split a text into the trigrams of its words
+def trigrams(text):
+    grams = set()
+    for word in _word_re.findall(text.lower()):
+        grams |= _word_trigrams(word)
+    return grams
+
+
+# An inverted index from trigrams to the packages containing them. Searching
+# only ever looks at the packages that share at least one gram with the query,
+# so we don't have to score the whole repo.
+class SearchIndex(object):
+    def __init__(self, records=()):
+        # Gram -> {key: weight}
+        self.postings = defaultdict(dict)
+        self.records = {}
+        for record in records:
+            self.add(record)
+
+    def _weighted_grams(self, record):
+        provides = " ".join(p.split("=")[0] for p in record.provides)
+        # The fields go from lowest to highest weight, so when a gram appears
+        # in more than one the highest weight wins
+        weights = dict.fromkeys(trigrams(record.desc), DESC_WEIGHT)
+        weights.update(dict.fromkeys(trigrams(provides), PROVIDES_WEIGHT))
+        weights.update(dict.fromkeys(trigrams(record.name), NAME_WEIGHT))
+        return weights
+
+    def add(self, record):
+        key = record.key
+        self.records[key] = record
+        postings = self.postings
+        for gram, weight in self._weighted_grams(record).items():
+            postings[gram][key] = weight
+
+    def remove(self, record):
+        if self.records.pop(record.key, None) is None:
+            return
+        for gram in self._weighted_grams(record).keys():
+            keys = self.postings.get(gram)
+            if keys is None:
+                continue
+            keys.pop(record.key, None)
+            if not keys:
+                del self.postings[gram]
+
+    # Return the best matching records, best first
+    def search(self, terms, limit=10):
+        grams = trigrams(terms)
+        if not grams:
+            return []
+
+        scores = defaultdict(float)
+        for gram in grams:
+            for key, weight in self.postings.get(gram, {}).items():
+                scores[key] += weight
+
+        ranked = []
+        for key, score in scores.items():
+            score = score / len(grams)
+            if score < SCORE_CUTOFF:
+                continue
+            # On a tie the shortest name is the closest match
+            name = self.records[key].name
+            ranked.append((-score, len(name), name, key))
+        ranked.sort()
+        return [self.records[key] for (_, _, _, key) in ranked[:limit]]
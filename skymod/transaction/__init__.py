@@ -19,3 +19,4 @@ from .remove import RemoveTransaction
 from .upgrade import UpgradeTransaction
 from .errors import *
 from .state import TransactionState
+from .plancache import PlanCache
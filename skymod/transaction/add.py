@@ -14,7 +14,6 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
-import networkx as nx
 import patoolib
 from colorama import Fore, Style
 from tqdm import tqdm
@@ -22,6 +21,7 @@ from tqdm import tqdm
 from skymod.cfg import config as cfg
 from skymod.config.vfs import VirtualFS
 from skymod.dirhashmap import DirMap
+from skymod.graph.order import install_order
 from skymod.package import InstallReason
 from skymod.repository import Query
 
@@ -32,27 +32,104 @@ from .errors import (
     TransactionCycleError
 )
 from .expander import Expander
+from .plancache import PlanCache
 from .state import TransactionState
 from .transaction import Transaction
 
 
 class AddTransaction(Transaction, ConflictFinder, Expander):
-    def __init__(self, installed, repo, downloader, reason, cache=None):
+    def __init__(
+        self,
+        installed,
+        repo,
+        downloader,
+        reason,
+        cache=None,
+        resolver=None,
+        plans=None
+    ):
         super().__init__(installed, repo, downloader)
         self.source_map = cache or DirMap(cfg.source.dir)
+        self.plans = plans or PlanCache(cfg.cache.dir / "plans.json")
         self.removes = []
         self.reason = reason
+        self.resolver = resolver
 
-    def _sort_deps_to_targets(self):
+    def _sort_deps_to_targets(self, order):
         assert(self.state == TransactionState.INIT)
-        self.touches = list(reversed(list(nx.topological_sort(self.depend_G))))
+        self.touches = order
         self.installs = [
             target for target in self.touches if not target.is_local
         ]
 
+    # A package in a plan is remembered by where it came from, along with its
+    # name and version. That's enough to find it again as long as neither
+    # repo changed
+    def _plan_ref(self, package):
+        side = "local" if package.is_local else "remote"
+        return [side, package.name, str(package.version)]
+
+    def _from_plan_ref(self, ref):
+        (side, name, version) = ref
+        repo = self.local_repo if side == "local" else self.repo
+        package = repo.find_literal(Query(name))
+        if package is None or str(package.version) != version:
+            return None
+        return package
+
+    # The key is everything the expansion depends on. We can't describe
+    # a resolver someone handed us, and we can't find targets that didn't
+    # come from the repo (like explicit package files) again, so those aren't
+    # cached at all
+    def _plan_key(self):
+        if self.resolver is not None:
+            return None
+        for target in self.targets:
+            if target.is_local:
+                return None
+            if self.repo.find_literal(Query(target.name)) is not target:
+                return None
+        return PlanCache.make_key(
+            sorted(self._plan_ref(t) for t in self.targets),
+            sorted(self._plan_ref(r) for r in self.removes),
+            self.repo.revision(),
+            self.local_repo.index.digest(),
+            [
+                cfg.resolver.engine,
+                cfg.resolver.prefer,
+                cfg.resolver.max_backtracks,
+            ]
+        )
+
+    def _restore_plan(self, plan):
+        touches = [self._from_plan_ref(ref) for ref in plan["touches"]]
+        removes = [self._from_plan_ref(ref) for ref in plan["removes"]]
+        if any(p is None for p in touches + removes):
+            return False
+        self.depend_G = super().packages_to_graph(touches)
+        self._sort_deps_to_targets(touches)
+        self.removes = removes
+        return True
+
     def expand(self):
         assert(self.state == TransactionState.INIT)
 
+        key = self._plan_key()
+        if key is not None:
+            plan = self.plans.get(key)
+            if plan is not None and self._restore_plan(plan):
+                self.state = TransactionState.EXPANDED
+                return
+
+        self._expand()
+        if key is not None:
+            self.plans.put(key, {
+                "touches": [self._plan_ref(p) for p in self.touches],
+                "removes": [self._plan_ref(p) for p in self.removes],
+            })
+        self.state = TransactionState.EXPANDED
+
+    def _expand(self):
         (expanded, missing) = self._expand_depedencies(
             self.local_repo,
             self.repo,
@@ -64,14 +141,16 @@ class AddTransaction(Transaction, ConflictFinder, Expander):
 
         self.depend_G = super().packages_to_graph(expanded)
 
-        try:
-            cycle = next(nx.simple_cycles(self.depend_G))
-        except StopIteration:
-            pass
-        else:
-            raise TransactionCycleError(cycle)
+        # Find the install order and every cycle in one go, if anything is
+        # broken we want to tell the user about all of it
+        (order, cycles) = install_order(
+            self.depend_G,
+            key=lambda p: p.name
+        )
+        if cycles:
+            raise TransactionCycleError(cycles)
 
-        self._sort_deps_to_targets()
+        self._sort_deps_to_targets(order)
 
         # Find all the packages that are upgrades rather than installs
         for package in expanded:
@@ -90,7 +169,6 @@ class AddTransaction(Transaction, ConflictFinder, Expander):
         if len(conflicts) > 0:
             # There were at least some conflicts
             raise ConflictError(conflicts)
-        self.state = TransactionState.EXPANDED
 
     def prepare(self):
         assert(self.state == TransactionState.EXPANDED)
@@ -101,7 +179,7 @@ class AddTransaction(Transaction, ConflictFinder, Expander):
         for t in self.installs:
             print("Collecting sources from {}".format(t.name))
             for s in t.sources:
-                fetches.add((s.uri, s.filename))
+                fetches.add((s.uri, s.filename, s.checksum))
 
         # Actually do the downloads
         files = self.downloader.fetch(fetches)
@@ -137,6 +215,14 @@ class AddTransaction(Transaction, ConflictFinder, Expander):
                     compression=encoding,
                 )
 
+        # Make room for what we just added. Nothing that's installed, or about
+        # to be, is thrown away
+        keep = self.local_repo.index.source_uris()
+        for t in self.installs:
+            keep.update(s.uri for s in t.sources)
+        self.downloader.evict(cfg.cache.max_size, keep)
+        self.source_map.evict(cfg.source.max_size, keep)
+
         # Populate the package_files list with the operations to complete
         for t in self.installs:
             vfs = VirtualFS()
@@ -199,15 +285,20 @@ class AddTransaction(Transaction, ConflictFinder, Expander):
     def commit(self):
         assert(self.state == TransactionState.PREPARED)
 
-        for target in self.removes:
-            # Remove all the upgrades first, they'll be installed again when we
-            # get to installing
-            print("Removing {}".format(target))
-            if target.pkgins.exists():
-                target.pkgins.rmtree()
-            self.local_repo.remove_package(target)
-
-        for target in self.installs:
-            self._commit_package(target)
+        try:
+            for target in self.removes:
+                # Remove all the upgrades first, they'll be installed again
+                # when we get to installing
+                print("Removing {}".format(target))
+                if target.pkgins.exists():
+                    target.pkgins.rmtree()
+                self.local_repo.remove_package(target)
+
+            for target in self.installs:
+                self._commit_package(target)
+        finally:
+            # Write out the local repo once for the whole transaction, even if
+            # we only got partway
+            self.local_repo.save()
 
         self.state = TransactionState.COMMITTED
@@ -14,63 +14,92 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
-from skymod.repository import Query
+from skymod.repository import BridgeIndex, intern_query
+
+
+# Conflicts keyed by the name they conflict with, so we can find everyone who
+# declared a conflict with a package by looking at the names it provides.
+class ConflictIndex(object):
+    def __init__(self, packages=()):
+        # Conflicted name -> [(package, query)]
+        self.conflicts = {}
+        for package in packages:
+            self.add(package)
+
+    def add(self, package):
+        for conflict in package.conflicts:
+            cq = intern_query(conflict)
+            self.conflicts.setdefault(cq.name, []).append((package, cq))
+
+    def remove(self, package):
+        for conflict in package.conflicts:
+            name = intern_query(conflict).name
+            declared = [
+                (p, cq) for (p, cq) in self.conflicts.get(name, ())
+                if p is not package
+            ]
+            if declared:
+                self.conflicts[name] = declared
+            else:
+                self.conflicts.pop(name, None)
+
+    # All the packages that declare a conflict with the given package
+    def find(self, package):
+        found = set()
+        for (name, _) in package.provided:
+            for (p, cq) in self.conflicts.get(name, ()):
+                if cq.matches(package):
+                    found.add(p)
+        return found
+
+    def items(self):
+        return self.conflicts.items()
 
 
 class ConflictFinder(object):
-    def _does_bridge(self, local_repo, targets, p1, p2):
+    def _does_bridge(self, local_repo, bridges, p1, p2):
         # Do we have a bridge already installed?
-        installed_bridges = local_repo.find_bridges(p1, p2)
-        if installed_bridges:
+        if local_repo.index.find_bridges(p1, p2):
             return True
 
         # Do any of the packages we are about to install offer to bridge this?
-        for package in targets:
-            for bridge in package.bridges:
-                b1 = Query(bridge[0])
-                b2 = Query(bridge[1])
-                if b1.matches(p1) and b2.matches(p2):
-                    return True
-                elif b2.matches(p1) and b1.matches(p2):
-                    return True
+        if bridges.find(p1, p2):
+            return True
         return False
 
+    # Instead of comparing everything with everything we only look at the
+    # declared conflicts, and use the indexes to find what they hit. The local
+    # packages come straight from the index, so we don't have to load any of
+    # them
     def _find_conflicts(self, targets, local_repo):
-        # Find conflicts inside targets
+        bridges = BridgeIndex(targets)
+        target_conflicts = ConflictIndex(targets)
+        local_conflicts = ConflictIndex(local_repo.index.records())
+
         conflicts = set()
-        for t in targets:
-            for conflict in t.conflicts:
-                cq = Query(conflict)
-                for tc in targets:
-                    # Packages don't conflict with themselves
-                    if t == tc:
-                        continue
-                    if (cq.matches(tc) and
-                            not self._does_bridge(local_repo, targets, t, tc)):
-                        conflicts.add((t, tc))
+        for tc in targets:
+            # Find conflicts inside targets
+            for t in target_conflicts.find(tc):
+                # Packages don't conflict with themselves
+                if t == tc:
+                    continue
+                if not self._does_bridge(local_repo, bridges, t, tc):
+                    conflicts.add((t, tc))
+
+            # Find conflicts from local_repo to targets
+            for lp in local_conflicts.find(tc):
+                if lp == tc:
+                    continue
+                if not self._does_bridge(local_repo, bridges, lp, tc):
+                    conflicts.add((lp, tc))
 
-        local_packages = local_repo.get_all_packages()
         # Find conflicts from targets to local_repo
-        for t in targets:
-            for conflict in t.conflicts:
-                cq = Query(conflict)
-                for lp in local_packages:
-                    # Packages don't conflict with themselves
+        for (name, declared) in target_conflicts.items():
+            for (lp, _) in local_repo.index.find_providers(name):
+                for (t, cq) in declared:
                     if t == lp:
                         continue
                     if (cq.matches(lp) and
-                            not self._does_bridge(local_repo, targets, t, lp)):
+                            not self._does_bridge(local_repo, bridges, t, lp)):
                         conflicts.add((t, lp))
-
-        # Find conflicts from local_repo to targets
-        for lp in local_packages:
-            for conflict in lp.conflicts:
-                cq = Query(conflict)
-                for tc in targets:
-                    # Packages don't conflict with themselves
-                    if lp == tc:
-                        continue
-                    if (cq.matches(tc) and
-                            not self._does_bridge(local_repo, targets, lp, tc)): # NOQA
-                        conflicts.add((lp, tc))
         return conflicts
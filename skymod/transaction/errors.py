@@ -14,9 +14,10 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+# cycles is a list of every group of packages that depend on each other
 class TransactionCycleError(Exception):
-    def __init__(self, cycle):
-        self.cycle = cycle
+    def __init__(self, cycles):
+        self.cycles = cycles
         super().__init__()
 
 class MissingDependencyError(Exception):
@@ -33,3 +34,11 @@ class ConflictError(Exception):
     def __init__(self, conflicts):
         self.conflicts = conflicts
         super().__init__()
+
+# The constraints put on a name by the packages requiring it can't all hold at
+# once. requirements is a list of (package, query) pairs
+class UnsatisfiableDependencyError(Exception):
+    def __init__(self, name, requirements):
+        self.name = name
+        self.requirements = requirements
+        super().__init__()
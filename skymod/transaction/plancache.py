@@ -0,0 +1,87 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import os
+
+# Bump this whenever the layout of a plan changes, a cache with another
+# version is thrown away
+PLAN_VERSION = 1
+
+
+# Expanding a transaction means running the resolver, which loads and checks
+# a whole lot of packages. The result only depends on what we asked for and on
+# the state of the two repos though, so we keep the plans around keyed by
+# exactly that. That way running the same install again, after a failed
+# download or after saying no at the prompt, doesn't have to redo any of it.
+class PlanCache(object):
+    def __init__(self, path, size=32):
+        self.path = path
+        # How many plans we keep, the oldest ones are dropped first
+        self.size = size
+        self.plans = None
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha1(
+            json.dumps(parts, sort_keys=True).encode()
+        ).hexdigest()
+
+    def _load(self):
+        if self.plans is not None:
+            return
+        self.plans = {}
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r") as infile:
+                data = json.load(infile)
+        except ValueError:
+            # A broken cache is no worse than a missing one
+            return
+        if data.get("version") != PLAN_VERSION:
+            return
+        self.plans = data["plans"]
+
+    def _save(self):
+        if not self.path.parent.exists():
+            self.path.parent.makedirs()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump({
+                "version": PLAN_VERSION,
+                "plans": self.plans,
+            }, outfile)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        self._load()
+        return self.plans.get(key)
+
+    def put(self, key, plan):
+        self._load()
+        # Reinsert to make it the newest
+        self.plans.pop(key, None)
+        self.plans[key] = plan
+        while len(self.plans) > self.size:
+            del self.plans[next(iter(self.plans))]
+        self._save()
+
+    def clear(self):
+        self.plans = {}
+        if self.path.exists():
+            self.path.remove()
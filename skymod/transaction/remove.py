@@ -14,8 +14,10 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import networkx as nx
+
 from skymod.package import InstallReason
-from skymod.repository import Query
+from skymod.repository import intern_query
 
 from .errors import ConflictError, DependencyBreakError
 from .state import TransactionState
@@ -39,7 +41,7 @@ class RemoveTransaction(Transaction):
     def _dependencies_filled_by_other(self, package):
         for dep_string in package.dependecies:
             dep_packages = self.local_repo.find_packages(
-                Query(dep_string),
+                intern_query(dep_string),
                 exclude=self.targets
             )
             if not dep_packages:
@@ -57,7 +59,11 @@ class RemoveTransaction(Transaction):
         return dependants
 
     def _does_bridge_after(self, p1, p2):
-        installed_bridges = self.local_repo.find_bridges(p1, p2, self.targets)
+        installed_bridges = self.local_repo.index.find_bridges(
+            p1,
+            p2,
+            self.targets
+        )
         if installed_bridges:
             return True
 
@@ -65,13 +71,13 @@ class RemoveTransaction(Transaction):
     def _check_conflict(self, p1, p2):
         # Does p1 conflict with p2
         for conflict in p1.conflicts:
-            cq = Query(conflict)
+            cq = intern_query(conflict)
             if cq.matches(p2) and not self._does_bridge_after(p1, p2):
                 return (p1, p2)
 
         # Does p2 conflict with p1
         for conflict in p2.conflicts:
-            cq = Query(conflict)
+            cq = intern_query(conflict)
             if cq.matches(p1) and not self._does_bridge_after(p2, p1):
                 return p2, p1
 
@@ -82,8 +88,8 @@ class RemoveTransaction(Transaction):
         conflicts = set()
         for package in self.removes:
             for (b1, b2) in package.bridges:
-                p1 = self.local_repo.find_package(Query(b1))
-                p2 = self.local_repo.find_package(Query(b2))
+                p1 = self.local_repo.find_package(intern_query(b1))
+                p2 = self.local_repo.find_package(intern_query(b2))
                 if not p1 or not p2:
                     # One of the sides were not installed, which means it's
                     # fine
@@ -96,24 +102,36 @@ class RemoveTransaction(Transaction):
                     conflicts.add((package, conflict))
         return conflicts
 
-    # @SPEED This is very slow and should probably be sped up. I don't know how
-    # though
+    # A target owns the dependencies it pulled in that nothing else needs.
+    # Everything below the targets in the installed graph is up for removal.
+    # We mark whatever is still needed, starting from every package we are
+    # keeping and never walking through a target, and sweep up the
+    # dependencies left unmarked.
     def _get_owned(self):
+        graph = self.local_repo.graph
+        targets = {t.name for t in self.targets}
+
+        below = set()
+        for name in targets:
+            if name in graph.G:
+                below |= nx.descendants(graph.G, name)
+        below -= targets
+
+        keep = [
+            n for n in graph.packages()
+            if n not in targets and
+            (n not in below or graph.reason(n) != InstallReason.DEP)
+        ]
+        marked = set(keep)
+        while keep:
+            for dep in graph.dependencies(keep.pop()):
+                if dep not in marked and dep not in targets:
+                    marked.add(dep)
+                    keep.append(dep)
+
         owned = set(self.targets)
-        # Here we want to process the same package multiple times
-        queue = set(self.targets)
-        while queue:
-            package = queue.pop()
-            if package.reason == InstallReason.DEP:
-                for depa in self.local_repo.find_dependants(package):
-                    if depa not in owned:
-                        break
-                else:
-                    owned.add(package)
-            for dep_str in package.dependecies:
-                deps = self.local_repo.find_packages(Query(dep_str))
-                for dep in deps:
-                    queue.add(dep)
+        for name in below - marked:
+            owned.add(self.local_repo.find_literal(intern_query(name)))
         return owned
 
     # Expanding a remove transaction is where we select the packages which no
@@ -156,7 +174,12 @@ class RemoveTransaction(Transaction):
     def commit(self):
         assert(self.state == TransactionState.PREPARED)
 
-        for target in self.removes:
-            self._commit_package(target)
+        try:
+            for target in self.removes:
+                self._commit_package(target)
+        finally:
+            # Write out the local repo once for the whole transaction, even if
+            # we only got partway
+            self.local_repo.save()
 
         self.state = TransactionState.COMMITTED
@@ -0,0 +1,373 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+from skymod.cfg import config as cfg
+from skymod.package import VersionRange
+from skymod.repository import BridgeIndex, intern_query
+
+from .conflictfinder import ConflictIndex
+from .errors import UnsatisfiableDependencyError
+
+
+# The plan is the set of packages a resolver has picked so far, along with
+# everything it needs to check the next pick against. Every change is recorded
+# on a trail so the search can roll back to an earlier choice cheaply instead
+# of copying the whole plan for every choice it makes.
+class _Plan(object):
+    def __init__(self, local_repo, exclude):
+        self.local_repo = local_repo
+        self.exclude = set(exclude)
+        self.packages = set()
+        # Provided name -> [(package, version)]
+        self.provided = {}
+        # Required name -> (range, [(package, query)])
+        self.ranges = {}
+        # Requirements still to be satisfied, as (package, query)
+        self.pending = []
+        self.conflicts = ConflictIndex()
+        self.bridges = BridgeIndex()
+        self.local_conflicts = ConflictIndex(
+            r for r in local_repo.index.records() if r not in self.exclude
+        )
+        self._trail = []
+
+    def mark(self):
+        return len(self._trail)
+
+    def undo(self, mark):
+        while len(self._trail) > mark:
+            entry = self._trail.pop()
+            if entry[0] == "package":
+                package = entry[1]
+                self.packages.discard(package)
+                for (name, _) in package.provided:
+                    providers = self.provided[name]
+                    providers.pop()
+                    if not providers:
+                        del self.provided[name]
+                self.conflicts.remove(package)
+                self.bridges.remove(package.name, package)
+            elif entry[0] == "range":
+                (_, name, old) = entry
+                if old is None:
+                    del self.ranges[name]
+                else:
+                    self.ranges[name] = old
+            elif entry[0] == "push":
+                self.pending.pop()
+            elif entry[0] == "pop":
+                self.pending.append(entry[1])
+
+    def add(self, package):
+        self.packages.add(package)
+        for (name, version) in package.provided:
+            self.provided.setdefault(name, []).append((package, version))
+        self.conflicts.add(package)
+        self.bridges.add(package.name, package)
+        self._trail.append(("package", package))
+
+    def range(self, name):
+        return self.ranges.get(name, (VersionRange(), []))[0]
+
+    # Narrow the versions acceptable for the name q requires. Returns the new
+    # range and everyone who had a say in it
+    def constrain(self, package, q):
+        old = self.ranges.get(q.name)
+        (range_, requirements) = old or (VersionRange(), [])
+        range_ = range_.intersect(q.range)
+        requirements = requirements + [(package, q)]
+        self.ranges[q.name] = (range_, requirements)
+        self._trail.append(("range", q.name, old))
+        return (range_, requirements)
+
+    def push(self, requirement):
+        self.pending.append(requirement)
+        self._trail.append(("push", ))
+
+    def pop(self):
+        if not self.pending:
+            return None
+        requirement = self.pending.pop()
+        self._trail.append(("pop", requirement))
+        return requirement
+
+    # The versions the plan provides the name at
+    def provided_versions(self, name):
+        return [version for (_, version) in self.provided.get(name, ())]
+
+    def satisfies(self, q):
+        range_ = self.range(q.name)
+        return any(
+            range_.contains(v) for v in self.provided_versions(q.name)
+        )
+
+    def is_bridged(self, p1, p2):
+        if self.local_repo.index.find_bridges(p1, p2, self.exclude):
+            return True
+        return bool(self.bridges.find(p1, p2))
+
+    # All the conflicts between the package and the plan or the installed
+    # packages that nothing bridges
+    def find_conflicts(self, package):
+        found = set()
+        for p in self.conflicts.find(package):
+            if p != package:
+                found.add((p, package))
+        for p in self.local_conflicts.find(package):
+            if p != package:
+                found.add((p, package))
+        for conflict in package.conflicts:
+            cq = intern_query(conflict)
+            for (p, _) in self.provided.get(cq.name, ()):
+                if p != package and cq.matches(p):
+                    found.add((package, p))
+            for (r, _) in self.local_repo.index.find_providers(cq.name):
+                if r != package and r not in self.exclude and cq.matches(r):
+                    found.add((package, r))
+        return {
+            (p1, p2) for (p1, p2) in found if not self.is_bridged(p1, p2)
+        }
+
+
+# Preference policies decide the order in which a resolver tries the
+# candidates for a requirement.
+class Preference(object):
+    def order(self, candidates, q, plan):
+        raise NotImplementedError()
+
+
+# Newest version first, with the name to keep things stable
+class PreferNewest(Preference):
+    def order(self, candidates, q, plan):
+        ordered = sorted(candidates, key=lambda c: c.name)
+        ordered.sort(key=lambda c: c.version, reverse=True)
+        return ordered
+
+
+# The candidate that pulls in the fewest new packages, judged by how many of
+# its dependencies are already installed or planned. Ties go to the newest
+class PreferFewestNew(PreferNewest):
+    def _rate(self, package, plan):
+        if not package.dependecies:
+            return 0
+        cnt = 0
+        for dep_str in package.dependecies:
+            dq = intern_query(dep_str)
+            if plan.satisfies(dq):
+                continue
+            installed = any(
+                dq.matches_version(version)
+                for (r, version) in
+                plan.local_repo.index.find_providers(dq.name)
+                if r not in plan.exclude
+            )
+            if installed:
+                continue
+            cnt += 1
+        return cnt / len(package.dependecies)
+
+    def order(self, candidates, q, plan):
+        ordered = super().order(candidates, q, plan)
+        ordered.sort(key=lambda c: self._rate(c, plan))
+        return ordered
+
+
+preferences = {
+    "fewest-new": PreferFewestNew,
+    "newest": PreferNewest,
+}
+
+
+# A resolver turns a set of targets into everything needed to install them.
+# It returns the packages, installed or not, along with the requirements it
+# couldn't find anything for, as (package, query).
+class Resolver(object):
+    def resolve(self, targets, local_repo, repo, exclude=()):
+        raise NotImplementedError()
+
+
+# Searches depth first through the provider choices. A choice is rejected if
+# it breaks the version constraints, or if it conflicts with the plan or the
+# installed packages and no bridge can be found for it. Rejecting a choice
+# sends us back to the most recent requirement that still has candidates left
+# to try. If no plan passes, or the search gives up, we fall back to taking the
+# preferred candidate every time, and leave it to the conflict finder and the
+# missing dependencies to explain what's wrong.
+class BacktrackingResolver(Resolver):
+    def __init__(self, preference=None, max_backtracks=10000):
+        self.preference = preference or PreferFewestNew()
+        self.max_backtracks = max_backtracks
+
+    # Add a package to the plan, along with its requirements. When we are
+    # strict a package with requirements that can't agree is just a bad
+    # choice, otherwise we report it
+    def _expand(self, plan, package, strict):
+        if package in plan.packages:
+            return True
+        plan.add(package)
+        # Installed packages aren't expanded. The user might have
+        # intentionally ignored dependencies when they installed the package,
+        # so we are just going to assume they know what they are doing.
+        if package.is_local:
+            return True
+        queries = [intern_query(d) for d in package.dependecies]
+        for q in queries:
+            (range_, requirements) = plan.constrain(package, q)
+            if range_.is_empty:
+                if strict:
+                    return False
+                raise UnsatisfiableDependencyError(q.name, requirements)
+        for q in reversed(queries):
+            plan.push((package, q))
+        return True
+
+    def _choose(self, plan, repo, package):
+        if not self._expand(plan, package, True):
+            return False
+        # Whatever is installed already has been checked against the other
+        # installed packages, and the new ones are checked against it
+        if package.is_local:
+            return True
+        # Conflicts can be settled by pulling in a bridge. We don't bridge
+        # the bridges though, that way lies madness
+        for (p1, p2) in plan.find_conflicts(package):
+            if plan.is_bridged(p1, p2):
+                continue
+            bridges = [
+                b for b in repo.find_bridges(p1, p2, exclude=plan.exclude)
+                if b not in plan.packages
+            ]
+            for bridge in self.preference.order(bridges, None, plan):
+                mark = plan.mark()
+                if (self._expand(plan, bridge, True) and
+                        not plan.find_conflicts(bridge)):
+                    break
+                plan.undo(mark)
+            else:
+                return False
+        return True
+
+    def _local_satisfier(self, plan, q, range_):
+        local = [
+            p for p in plan.local_repo.find_packages(q, exclude=plan.exclude)
+            if range_.provides(p, q.name)
+        ]
+        if not local:
+            return None
+        return self.preference.order(local, q, plan)[0]
+
+    def _is_missing(self, plan, repo, q):
+        if plan.local_repo.find_packages(q, exclude=plan.exclude):
+            return False
+        return not repo.find_packages(q, exclude=plan.exclude)
+
+    # The packages that could satisfy the requirement, in the order we want
+    # to try them. None means it's satisfied already
+    def _candidates(self, plan, repo, q):
+        if plan.satisfies(q):
+            return None
+        range_ = plan.range(q.name)
+        local = self._local_satisfier(plan, q, range_)
+        if local is not None:
+            return [local]
+        candidates = [
+            c for c in repo.find_packages(q, exclude=plan.exclude)
+            if range_.provides(c, q.name)
+        ]
+        return self.preference.order(candidates, q, plan)
+
+    def _search(self, plan, repo, targets):
+        # The targets get the same conflict check as everything else, so
+        # a conflict with an installed package can be bridged right away
+        for target in targets:
+            if not self._choose(plan, repo, target):
+                return False
+
+        choices = []
+        backtracks = 0
+        while True:
+            requirement = plan.pop()
+            if requirement is None:
+                return True
+            (_, q) = requirement
+            candidates = self._candidates(plan, repo, q)
+            if candidates is None:
+                continue
+            # Something else in the plan provides the name, just not at
+            # a version everyone agrees on. That's a dead end
+            if plan.provided_versions(q.name):
+                candidates = []
+            # If nothing provides the name at all there's no point in trying
+            # other choices, it's a missing dependency
+            elif not candidates and self._is_missing(plan, repo, q):
+                return False
+
+            mark = plan.mark()
+            remaining = iter(candidates)
+            while True:
+                candidate = next(remaining, None)
+                if candidate is None:
+                    if not choices or backtracks >= self.max_backtracks:
+                        return False
+                    backtracks += 1
+                    (mark, remaining) = choices.pop()
+                    plan.undo(mark)
+                    continue
+                if self._choose(plan, repo, candidate):
+                    choices.append((mark, remaining))
+                    break
+                plan.undo(mark)
+
+    # Take the preferred candidate every time, no questions asked
+    def _greedy(self, plan, repo, targets):
+        missing = set()
+        for target in targets:
+            self._expand(plan, target, False)
+
+        while True:
+            requirement = plan.pop()
+            if requirement is None:
+                return missing
+            candidates = self._candidates(plan, repo, requirement[1])
+            if candidates is None:
+                continue
+            if not candidates:
+                missing.add(requirement)
+                continue
+            self._expand(plan, candidates[0], False)
+
+    def resolve(self, targets, local_repo, repo, exclude=()):
+        targets = list(targets)
+        plan = _Plan(local_repo, exclude)
+        if self._search(plan, repo, targets):
+            return (plan.packages, set())
+
+        plan = _Plan(local_repo, exclude)
+        missing = self._greedy(plan, repo, targets)
+        return (plan.packages, missing)
+
+
+resolvers = {
+    "backtracking": BacktrackingResolver,
+}
+
+
+def make_resolver():
+    preference = preferences[cfg.resolver.prefer]()
+    return resolvers[cfg.resolver.engine](
+        preference=preference,
+        max_backtracks=cfg.resolver.max_backtracks
+    )
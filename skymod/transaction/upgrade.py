@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with skymod.  If not, see <http://www.gnu.org/licenses/>.
 from skymod.package import InstallReason
-from skymod.repository import Query
+from skymod.repository import Query, intern_query
 
 from .add import AddTransaction
 from .errors import MissingDependencyError
@@ -38,26 +38,36 @@ class UpgradeTransaction(AddTransaction, Expander):
         if remote_package.version > package.version:
             self.targets.add(remote_package)
 
+    # The version check is a join between the local and remote index, so we
+    # only have to load the packages that actually need an upgrade. Without
+    # any targets we check everything installed
     def _find_upgrade_required(self, targets):
-        upgrade = set()
+        installed = {}
         for package in targets:
             assert(package.is_local)
-            q = Query(package.name)
-            remote_package = self.repo.find_literal(q)
-            if remote_package is None:
-                print("No remote package for {}".format(package))
+            installed[package.name] = package
+        names = installed.keys() if targets else None
+
+        local_index = self.local_repo.index
+        remote_index = self.repo.index
+        for record in local_index.records():
+            if names is not None and record.name not in names:
                 continue
-            if remote_package.version > package.version:
-                upgrade.add((package, remote_package))
+            if remote_index.get(record.name) is None:
+                print("No remote package for {}".format(record))
+
+        upgrade = set()
+        for (record, _) in local_index.find_outdated(remote_index, names):
+            q = Query(record.name)
+            package = installed.get(record.name)
+            if package is None:
+                package = self.local_repo.find_literal(q)
+            upgrade.add((package, self.repo.find_literal(q)))
         return upgrade
 
     # An upgrade transaction is the same as an add except it checks if anything
     # needs updating and adds that to the targets. So do that here
     def expand(self):
-        # If theres no targets, expand to all local packages
-        if not self.targets:
-            self.targets = self.local_repo.get_all_packages()
-
         upgrades = self._find_upgrade_required(self.targets)
         self.removes = [u[0] for u in upgrades]
         self.installs = [u[1] for u in upgrades]
@@ -90,7 +100,7 @@ class UpgradeTransaction(AddTransaction, Expander):
                     continue
 
                 for dep_str in dependant.dependecies:
-                    q = Query(dep_str)
+                    q = intern_query(dep_str)
                     # If it didn't match before then we don't care
                     # This is important because we don't want to pop up and
                     # error now if the user purposefully broke some
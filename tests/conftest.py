@@ -0,0 +1,73 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import pytest
+from path import Path
+
+from skymod.cfg import config as cfg
+from skymod.cfg import read_config
+
+
+class Organizer(object):
+    def __init__(self, mods_dir):
+        self.mods_dir = mods_dir
+
+    def getModsDir(self):
+        return self.mods_dir
+
+
+# A config of our own, with all the directories inside the test directory.
+# The index is built in process, the pool is overkill for a handful of
+# packages
+@pytest.fixture
+def config(tmp_path):
+    root = Path(str(tmp_path))
+    read_config(root / "config.ini")
+    cfg.repo.dir = root / "repo"
+    cfg.repo.index_workers = 1
+    cfg.cache.dir = root / "cache"
+    cfg.source.dir = root / "source"
+    cfg.source.dir.makedirs_p()
+    return cfg
+
+
+@pytest.fixture
+def organizer(tmp_path):
+    mods_dir = Path(str(tmp_path)) / "mods"
+    mods_dir.makedirs_p()
+    return Organizer(mods_dir)
+
+
+def _write_modbuild(root, name, version="1.0", depends=()):
+    package_dir = root / name
+    package_dir.makedirs_p()
+    lines = [
+        'name = "{}"'.format(name),
+        'version = "{}"'.format(version),
+        'desc = "{} package"'.format(name),
+    ]
+    if depends:
+        lines.append("depends = {{{}}}".format(
+            ", ".join('"{}"'.format(d) for d in depends)
+        ))
+    lines.append("function package()\nend\n")
+    (package_dir / "modbuild.lua").write_text("\n".join(lines))
+
+
+# Writes a minimal modbuild for a package into root
+@pytest.fixture
+def write_modbuild():
+    return _write_modbuild
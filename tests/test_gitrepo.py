@@ -0,0 +1,150 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import subprocess
+
+import pytest
+from path import Path
+
+from skymod.repository import GitRemotePackageRepo, Query
+from skymod.repository.errors import DivergedRepoError
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ("git",) + args,
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.strip()
+
+
+@pytest.fixture(autouse=True)
+def identity(monkeypatch):
+    for role in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv("GIT_{}_NAME".format(role), "skymod")
+        monkeypatch.setenv("GIT_{}_EMAIL".format(role), "skymod@localhost")
+
+
+# A bare repo standing in for the remote, and a clone of it we push new
+# packages from. Shallow and partial clones need a file:// url, git
+# ignores both when cloning a plain path
+class Remote(object):
+    def __init__(self, root, write_modbuild):
+        self.bare = root / "remote.git"
+        self.work = root / "work"
+        self.write_modbuild = write_modbuild
+        git(root, "init", "-q", "--bare", str(self.bare))
+        git(self.bare, "config", "uploadpack.allowFilter", "true")
+        git(root, "init", "-q", str(self.work))
+        git(self.work, "checkout", "-q", "-b", "master")
+
+    @property
+    def url(self):
+        return "file://" + self.bare
+
+    def commit(self, *packages):
+        for (name, version) in packages:
+            self.write_modbuild(self.work, name, version)
+        git(self.work, "add", "-A")
+        git(self.work, "commit", "-qm", "Update packages")
+        git(self.work, "push", "-q", str(self.bare), "master")
+        return git(self.work, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def remote(tmp_path, write_modbuild):
+    remote = Remote(Path(str(tmp_path)), write_modbuild)
+    remote.commit(("skse", "1.7"), ("fnis", "7.0"))
+    remote.commit(("skyui", "5.1"))
+    remote.commit(("fnis", "7.1"))
+    return remote
+
+
+def make_repo(config, organizer, remote, depth=0, filter_=""):
+    return GitRemotePackageRepo(
+        organizer,
+        config.repo.dir,
+        remote.url,
+        depth,
+        filter_
+    )
+
+
+def version_of(repo, name):
+    return str(repo.find_package(Query(name)).version)
+
+
+def test_clone_depth(config, organizer, remote):
+    repo = make_repo(config, organizer, remote, depth=1)
+
+    assert git(repo.root, "rev-parse", "--is-shallow-repository") == "true"
+    assert git(repo.root, "rev-list", "--count", "HEAD") == "1"
+    assert version_of(repo, "fnis") == "7.1"
+    assert len(repo.index) == 3
+
+
+def test_clone_filter(config, organizer, remote):
+    repo = make_repo(config, organizer, remote, filter_="blob:none")
+
+    assert git(repo.root, "config", "remote.origin.promisor") == "true"
+    assert git(
+        repo.root, "config", "remote.origin.partialclonefilter"
+    ) == "blob:none"
+    assert git(repo.root, "rev-list", "--count", "HEAD") == "3"
+    assert version_of(repo, "skyui") == "5.1"
+
+
+def test_update_fast_forward(config, organizer, remote):
+    repo = make_repo(config, organizer, remote)
+    head = remote.commit(("fnis", "7.2"), ("xpmse", "4.3"))
+
+    changed = repo.update()
+
+    assert changed == {"fnis", "xpmse"}
+    assert repo.repo.head.commit.hexsha == head
+    assert version_of(repo, "fnis") == "7.2"
+    assert version_of(repo, "xpmse") == "4.3"
+
+
+def test_update_shallow(config, organizer, remote):
+    repo = make_repo(config, organizer, remote, depth=1)
+    remote.commit(("skse", "1.8"))
+    head = remote.commit(("skyui", "5.2"))
+
+    changed = repo.update()
+
+    assert changed == {"skse", "skyui"}
+    assert repo.repo.head.commit.hexsha == head
+    assert git(repo.root, "rev-parse", "--is-shallow-repository") == "true"
+    assert version_of(repo, "skyui") == "5.2"
+
+
+def test_update_shallow_keeps_diverged_commits(config, organizer, remote):
+    repo = make_repo(config, organizer, remote, depth=1)
+    # A commit of our own, that the remote doesn't know about
+    remote.write_modbuild(repo.root, "local", "1.0")
+    git(repo.root, "add", "-A")
+    git(repo.root, "commit", "-qm", "Local package")
+    local_head = git(repo.root, "rev-parse", "HEAD")
+    remote.commit(("skyui", "5.2"))
+
+    with pytest.raises(DivergedRepoError):
+        repo.update()
+
+    assert git(repo.root, "rev-parse", "HEAD") == local_head
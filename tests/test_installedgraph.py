@@ -0,0 +1,30 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import subprocess
+import sys
+
+from path import Path
+
+
+# Has to be a fresh interpreter, by the time the tests run everything is
+# already imported
+def test_import_on_its_own():
+    subprocess.run(
+        [sys.executable, "-c", "import skymod.graph.installed"],
+        cwd=Path(__file__).parent.parent,
+        check=True,
+    )
@@ -0,0 +1,47 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import pytest
+
+from skymod.package import InstallReason
+from skymod.repository import LocalDbPackageRepo, Query
+from skymod.repository.packagerepo import PackageRepo
+
+
+@pytest.fixture
+def local(config, organizer, write_modbuild):
+    for name in ("skse", "skyui"):
+        write_modbuild(config.repo.dir, name)
+    repo = PackageRepo(organizer, config.repo.dir)
+    root = config.repo.dir.parent / "local"
+    root.makedirs_p()
+    local = LocalDbPackageRepo(organizer, root)
+    for name in ("skse", "skyui"):
+        local.add_package(InstallReason.REQ, repo.find_package(Query(name)))
+    return local
+
+
+def test_reload_drops_removed_rows(local):
+    assert {p.name for p in local.get_all_packages()} == {"skse", "skyui"}
+
+    # Someone else removed it behind our back
+    with local.db:
+        local.db.execute("DELETE FROM packages WHERE name = 'skyui'")
+    local.reload_index()
+
+    assert {p.name for p in local.get_all_packages()} == {"skse"}
+    assert local.find_package(Query("skyui")) is None
+    assert not local.index.dirty
@@ -0,0 +1,63 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import pytest
+
+from skymod.repository import Query, indexbuilder
+from skymod.repository.packagerepo import PackageRepo
+
+
+@pytest.fixture
+def repo_dir(config, write_modbuild):
+    root = config.repo.dir
+    write_modbuild(root, "good", "1.0")
+    (root / "broken").makedirs_p()
+    (root / "broken" / "modbuild.lua").write_text('name = "broken\n')
+    return root
+
+
+# With more than one worker the modbuilds are evaluated in the pool
+@pytest.mark.parametrize("workers", [1, 2])
+def test_broken_modbuild_is_skipped(
+        config, organizer, repo_dir, workers, monkeypatch):
+    config.repo.index_workers = workers
+    monkeypatch.setattr(indexbuilder, "PARALLEL_THRESHOLD", 1)
+    repo = PackageRepo(organizer, repo_dir)
+
+    assert str(repo.find_package(Query("good")).version) == "1.0"
+    assert repo.find_package(Query("broken")) is None
+    assert "broken" in repo.index.broken
+    assert [r.key for r in repo.index.records()] == ["good"]
+
+
+def test_broken_modbuild_is_kept_until_changed(
+        config, organizer, repo_dir, write_modbuild, monkeypatch):
+    PackageRepo(organizer, repo_dir).index
+
+    # The broken package is remembered in the saved index, so a new repo
+    # doesn't evaluate anything
+    def load_record(self, key):
+        raise AssertionError("evaluated " + key)
+    monkeypatch.setattr(PackageRepo, "_load_record", load_record)
+    repo = PackageRepo(organizer, repo_dir)
+    assert "broken" in repo.index.broken
+    monkeypatch.undo()
+
+    write_modbuild(repo_dir, "broken", "2.0")
+    repo = PackageRepo(organizer, repo_dir)
+
+    assert not repo.index.broken
+    assert str(repo.find_package(Query("broken")).version) == "2.0"
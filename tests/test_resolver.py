@@ -0,0 +1,100 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+from skymod.package import LocalPackageRecord, PackageRecord
+from skymod.repository.index import PackageIndex
+from skymod.transaction.conflictfinder import ConflictFinder
+from skymod.transaction.resolver import BacktrackingResolver
+
+
+class MemorySource(object):
+    def keys(self):
+        return []
+
+    def exists(self, key):
+        return True
+
+    def stamp(self, key):
+        return None
+
+    def digest(self, key):
+        return None
+
+
+# Just enough of a repo for the resolver, answered straight from the index
+class MemoryRepo(object):
+    def __init__(self, records):
+        self.index = PackageIndex(MemorySource(), None)
+        for record in records:
+            self.index.update(record.key, record)
+
+    def find_packages(self, query, exclude=set()):
+        return {
+            r for r in self.index.records()
+            if query.matches(r) and r not in exclude
+        }
+
+    def find_bridges(self, p1, p2, exclude=set()):
+        return set(self.index.find_bridges(p1, p2, exclude))
+
+
+def remote(name, **kwargs):
+    return PackageRecord(name, name, **kwargs)
+
+
+def installed(name, **kwargs):
+    return LocalPackageRecord(name, name, **kwargs)
+
+
+def resolve(targets, local, repo):
+    (packages, missing) = BacktrackingResolver().resolve(
+        targets,
+        MemoryRepo(local),
+        MemoryRepo(repo)
+    )
+    assert not missing
+    return packages
+
+
+def test_bridges_target_conflicting_with_installed():
+    app = remote("app", conflicts=["ui"])
+    bridge = remote("brg", bridges=[("app", "ui")])
+    local = [installed("ui")]
+
+    packages = resolve([app], local, [bridge])
+
+    assert {p.name for p in packages} == {"app", "brg"}
+    assert not ConflictFinder()._find_conflicts(packages, MemoryRepo(local))
+
+
+def test_bridges_dependency_conflicting_with_installed():
+    top = remote("top", depends=["app"])
+    app = remote("app", conflicts=["ui"])
+    bridge = remote("brg", bridges=[("app", "ui")])
+
+    packages = resolve([top], [installed("ui")], [app, bridge])
+
+    assert {p.name for p in packages} == {"top", "app", "brg"}
+
+
+def test_bridges_conflicting_targets():
+    first = remote("first", conflicts=["second"])
+    second = remote("second")
+    bridge = remote("brg", bridges=[("first", "second")])
+
+    packages = resolve([first, second], [], [bridge])
+
+    assert {p.name for p in packages} == {"first", "second", "brg"}
@@ -0,0 +1,272 @@
+# Copyright 2017 Jesper Jensen (delusionallogic)
+#
+# This file is part of skymod.
+#
+# skymod is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skymod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skymod.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from path import Path
+from requests.exceptions import RequestException
+
+from skymod.handler.down.simplehttp import SimpleHttpDownloader
+
+
+# A file server that can be told to break off its responses partway, or to
+# change the file between requests. It answers Range requests the way a real
+# server would, and logs the Range and If-Range of every request it gets.
+class FileServer(object):
+    def __init__(self):
+        self.data = os.urandom(256 * 1024)
+        self.etag = '"v1"'
+        self.last_modified = None
+        self.ranges = True
+        # How many of the next responses to cut off a third of the way in
+        self.drops = 0
+        # Sent after the range we were asked for, like a broken server would
+        self.extra = b""
+        self.requests = []
+
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = HTTPServer(("127.0.0.1", 0), RequestHandler)
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever,
+            kwargs={"poll_interval": 0.05}
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/file".format(self.httpd.server_address[1])
+
+    # Replace the file with a new version
+    def change(self, etag=None, last_modified=None):
+        self.data = os.urandom(len(self.data))
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def _start(self, request):
+        range_ = request.headers.get("Range")
+        if range_ is None or not self.ranges:
+            return 0
+        if_range = request.headers.get("If-Range")
+        if if_range is not None and if_range not in (
+                self.etag, self.last_modified):
+            return 0
+        return int(range_.split("=")[1].rstrip("-"))
+
+    def handle(self, request):
+        self.requests.append((
+            request.headers.get("Range"),
+            request.headers.get("If-Range"),
+        ))
+        start = self._start(request)
+        if start >= len(self.data):
+            request.send_response(416)
+            request.send_header(
+                "Content-Range", "bytes */{}".format(len(self.data))
+            )
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+
+        body = self.data[start:]
+        if start > 0:
+            body += self.extra
+        request.send_response(206 if start > 0 else 200)
+        request.send_header("Content-Length", str(len(body)))
+        if start > 0:
+            request.send_header("Content-Range", "bytes {}-{}/{}".format(
+                start, len(self.data) - 1, len(self.data)
+            ))
+        if self.etag is not None:
+            request.send_header("ETag", self.etag)
+        if self.last_modified is not None:
+            request.send_header("Last-Modified", self.last_modified)
+        request.end_headers()
+
+        if self.drops > 0:
+            self.drops -= 1
+            request.wfile.write(body[:len(body) // 3])
+            request.wfile.flush()
+            request.close_connection = True
+            request.connection.shutdown(2)
+            return
+        request.wfile.write(body)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = FileServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def target(tmp_path):
+    return Path(str(tmp_path)) / "file"
+
+
+def download(server, target, retries=3):
+    downloader = SimpleHttpDownloader()
+    downloader.retries = retries
+    downloader.download_file("file", server.url, {}, target)
+
+
+def meta_of(target):
+    with open(target + ".json", "r") as infile:
+        return json.load(infile)
+
+
+def test_resumes_broken_download(server, target):
+    server.drops = 1
+
+    download(server, target)
+
+    # We only get to keep what made it to disk, which isn't necessarily all
+    # the server sent
+    ((first, _), (second, if_range)) = server.requests
+    assert first is None
+    assert second.startswith("bytes=") and second.endswith("-")
+    assert 0 < int(second[len("bytes="):-1]) < len(server.data)
+    assert if_range == '"v1"'
+    assert target.bytes() == server.data
+    assert not Path(target + ".json").exists()
+
+
+def test_resumes_in_later_run(server, target):
+    server.drops = 1
+    with pytest.raises(RequestException):
+        download(server, target, retries=0)
+
+    cut = target.size
+    assert 0 < cut < len(server.data)
+    assert meta_of(target) == {
+        "etag": '"v1"',
+        "last_modified": None,
+        "length": len(server.data),
+    }
+
+    download(server, target)
+
+    assert server.requests[-1] == ("bytes={}-".format(cut), '"v1"')
+    assert target.bytes() == server.data
+
+
+def test_changed_etag_starts_over(server, target):
+    server.drops = 1
+    with pytest.raises(RequestException):
+        download(server, target, retries=0)
+    server.change(etag='"v2"')
+
+    download(server, target)
+
+    # We asked for the rest of the old file, and got all of the new one
+    assert server.requests[-1][1] == '"v1"'
+    assert target.bytes() == server.data
+
+
+def test_changed_last_modified_starts_over(server, target):
+    server.etag = None
+    server.last_modified = "Wed, 21 Oct 2015 07:28:00 GMT"
+    server.drops = 1
+    with pytest.raises(RequestException):
+        download(server, target, retries=0)
+    server.change(last_modified="Thu, 22 Oct 2015 07:28:00 GMT")
+
+    download(server, target)
+
+    assert server.requests[-1][1] == "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert target.bytes() == server.data
+
+
+def test_weak_etag_is_not_resumed(server, target):
+    server.etag = 'W/"v1"'
+    server.drops = 1
+
+    download(server, target)
+
+    assert server.requests == [(None, None), (None, None)]
+    assert target.bytes() == server.data
+
+
+def test_server_without_ranges_starts_over(server, target):
+    server.ranges = False
+    server.drops = 1
+
+    download(server, target)
+
+    assert server.requests[1][0] is not None
+    assert target.bytes() == server.data
+
+
+def test_wrong_range_starts_over(server, target):
+    server.drops = 1
+    with pytest.raises(RequestException):
+        download(server, target, retries=0)
+    # The server still thinks it's the same file, but it's shorter now
+    server.data = server.data[:len(server.data) // 2]
+
+    download(server, target)
+
+    # The 206 didn't fit what we had, so we threw it away and asked again
+    assert server.requests[-1] == (None, None)
+    assert target.bytes() == server.data
+
+
+def test_complete_download_is_not_fetched_again(server, target):
+    target.write_bytes(server.data)
+    with open(target + ".json", "w") as outfile:
+        json.dump({
+            "etag": server.etag,
+            "last_modified": None,
+            "length": len(server.data),
+        }, outfile)
+
+    download(server, target)
+
+    assert server.requests == [
+        ("bytes={}-".format(len(server.data)), '"v1"'),
+    ]
+    assert target.bytes() == server.data
+    assert not Path(target + ".json").exists()
+
+
+def test_download_longer_than_file_is_discarded(server, target):
+    server.drops = 1
+    server.extra = b"garbage"
+
+    with pytest.raises(RuntimeError):
+        download(server, target)
+
+    assert not target.exists()
+    assert not Path(target + ".json").exists()